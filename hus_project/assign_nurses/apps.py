@@ -1,6 +1,27 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def serves_requests():
+    """ Whether this process serves the app: not a pool worker, nor a manage.py command other than runserver. """
+    from .endpoints.parallel import WORKER_ENV
+    if os.environ.get(WORKER_ENV):
+        return False
+    if os.path.basename(sys.argv[0]) == 'manage.py':
+        # The autoreloader's parent process only watches the code
+        return sys.argv[1:2] == ['runserver'] and (os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv)
+    return True
 
 
 class AssignNursesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'assign_nurses'
+
+    def ready(self):
+        # Preloaded in a background thread: ready() must not block on the files nor query the database
+        if settings.PRELOAD_INPUTS and serves_requests():
+            from .endpoints import preload
+            preload.start()
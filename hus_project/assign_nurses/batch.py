@@ -0,0 +1,109 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from .endpoints import parallel
+from .endpoints.metrics import request_context, stage
+from .endpoints.nurses import get_roster, get_nurse_shift
+from .endpoints.historic import get_historic, load_inputs
+from .endpoints.rooms import distribute_rooms
+from .endpoints.assign import assign_nurses
+from .endpoints.render import SkipRender
+batch_workers = settings.BATCH_WORKERS
+
+SHIFTS = ['M', 'T', 'N']
+WORKBOOK_HEADERS = ['Fecha', 'Turno', 'Grupo', 'ID Enfermera', 'Habitaciones', 'Nº Pacientes', 'Error']
+
+# Inputs of the batch being solved, set once per worker process by init_worker
+worker_inputs = None
+
+def date_range(start, end):
+    """ Every date from start to end, both included. """
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+def load_batch_inputs(dates):
+    """ Load the rosters of the months in dates, the admissions and the history once for the whole batch. """
+    with stage('batch.load_inputs'):
+        rosters = {}
+        for query_date in dates:
+            month_year = query_date.strftime("%Y-%m")
+            if month_year not in rosters:
+                rosters[month_year] = get_roster(query_date)
+        inputs = load_inputs()
+    inputs['rosters'] = rosters
+    return inputs
+
+def solve(query_date, query_shift, inputs):
+    """ Assignation of one shift from preloaded inputs, without rendering images.
+
+    Errors are reported in the result so that one bad shift doesn't stop the rest of the plan.
+    """
+    str_date = query_date.strftime("%Y-%m-%d")
+    try:
+        with request_context(date=str_date, shift=query_shift), stage('batch.solve'):
+            roster = inputs['rosters'][query_date.strftime("%Y-%m")]
+            date, shift, nurses = get_nurse_shift(query_date, query_shift, roster)
+            if not nurses:
+                return {'date': str_date, 'shift': query_shift, 'error': 'No hay enfermeras en el turno'}
+
+            occupied_rooms, rooms_per_control, historic = get_historic(date, shift, nurses, inputs)
+            distributed_rooms = distribute_rooms(occupied_rooms, rooms_per_control, str_date, query_shift, SkipRender())
+            best_mapping = assign_nurses(distributed_rooms, nurses, historic, query_date, str_date, query_shift, SkipRender())
+    except Exception as e:
+        print(f"[WARN]: Error en la asignación del {str_date}, turno {query_shift}: {e}")
+        return {'date': str_date, 'shift': query_shift, 'error': str(e)}
+
+    return {'date': str_date, 'shift': query_shift, 'data': best_mapping}
+
+def init_worker(inputs):
+    global worker_inputs
+    parallel.setup_worker()
+    # The batch already fills every worker, so controls are solved in the worker itself
+    parallel.control_workers = 1
+    worker_inputs = inputs
+
+def solve_in_worker(query_date, query_shift):
+    return solve(query_date, query_shift, worker_inputs)
+
+def plan_batch(start, end, shifts=SHIFTS, workers=None):
+    """ Yield the assignation of every shift from start to end, in date and shift order, as they are solved.
+
+    The inputs are loaded once and sent once to each worker process, instead of once per shift.
+    """
+    dates = date_range(start, end)
+    tasks = [(query_date, query_shift) for query_date in dates for query_shift in shifts]
+    inputs = load_batch_inputs(dates)
+
+    workers = batch_workers if workers is None else workers
+    if workers <= 1 or len(tasks) <= 1:
+        for query_date, query_shift in tasks:
+            yield solve(query_date, query_shift, inputs)
+        return
+
+    pool = ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=init_worker, initargs=(inputs,))
+    try:
+        yield from pool.map(solve_in_worker, *zip(*tasks))
+    finally:
+        # Stop queued shifts if the consumer goes away, e.g. a closed streaming response
+        pool.shutdown(cancel_futures=True)
+
+def to_ndjson(results):
+    """ One JSON line per shift result. """
+    for result in results:
+        yield json.dumps(result, ensure_ascii=False) + "\n"
+
+def write_workbook(results, output):
+    """ Write the results to an Excel workbook with one row per group, output being a path or a file object. """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Asignaciones')
+    sheet.append(WORKBOOK_HEADERS)
+    for result in results:
+        if 'error' in result:
+            sheet.append([result['date'], result['shift'], None, None, None, None, result['error']])
+            continue
+        for group, (nurse, rooms, n_patients) in result['data'].items():
+            sheet.append([result['date'], result['shift'], group, nurse, rooms, n_patients, None])
+    workbook.save(output)
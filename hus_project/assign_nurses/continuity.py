@@ -0,0 +1,147 @@
+from datetime import timedelta
+from fractions import Fraction
+
+import numpy as np
+
+from django.conf import settings
+from .batch import SHIFTS, date_range, load_batch_inputs
+from .endpoints import historic
+from .endpoints.assign import extract_and_assign_groups, format_mapping, group_membership, merge_historial_resume, pair_matrices
+from .endpoints.kbest import lexicographic_weights
+from .endpoints.metrics import request_context, stage
+from .endpoints.nurses import get_nurse_shift
+from .endpoints.render import SkipRender
+from .endpoints.rooms import distribute_rooms
+continuity_weight = settings.CONTINUITY_WEIGHT
+
+# Finest fraction of a cost unit a continuity weight is taken to
+MAX_WEIGHT_DENOMINATOR = 1000
+
+# Shift starting when each base shift ends, and the days it is ahead of it
+NEXT_SHIFT = {'M': ('T', 0), 'T': ('N', 0), 'N': ('M', 1)}
+
+def follows(previous, current):
+    """ Whether the (date, shift) current starts right after previous, e.g. T after M or M after the night before. """
+    if previous is None:
+        return False
+    next_shift, days = NEXT_SHIFT[previous[1]]
+    return current == (previous[0] + timedelta(days=days), next_shift)
+
+def day_pairs(query_date, day_nurses, inputs):
+    """ Pair cost and treatments of every nurse working a shift of query_date with every occupied room.
+
+    The history summary and the pair arrays are computed once for the day; each shift takes the rows
+    of its nurses.
+    """
+    controls = inputs['controls']
+    summary = historic.treatment_historial(
+        historic.file_historic, controls, day_nurses, query_date.date(), inputs['history'], inputs.get('beds')
+    )
+    room_index = {}
+    for control_dict in controls.values():
+        for room in control_dict.values():
+            room_index.setdefault(room, len(room_index))
+    pair_cost, pair_treatments = pair_matrices(day_nurses, room_index, merge_historial_resume(summary), query_date)
+    return {
+        'nurses': {nurse: i for i, nurse in enumerate(day_nurses)},
+        'rooms': room_index,
+        'cost': pair_cost,
+        'treatments': pair_treatments,
+    }
+
+def continuity_weights(cost_matrix, treatments_matrix, continuity_matrix, weight):
+    """ Nurses x groups weights of the lowest cost minus weight per room kept and, among those, the most treatments.
+
+    Ties are broken by the treatments as in create_branch_schema, so weight 0 gives the independent assignment.
+    The objective is counted in 1/denominator of the weight, so a fractional weight keeps it integer.
+    """
+    weight = Fraction(weight).limit_denominator(MAX_WEIGHT_DENOMINATOR)
+    primary = cost_matrix * weight.denominator - continuity_matrix * weight.numerator
+    return lexicographic_weights(cost_matrix, treatments_matrix, primary)
+
+def solve_shift(query_date, query_shift, nurses, inputs, day, distributions, held, weight):
+    """ Assign one shift from the day pair arrays, discounting weight per room a nurse keeps from their previous shift.
+
+    held maps the nurses of the previous shift to the rooms they had. Returns the formatted mapping,
+    the rooms held by each nurse in this shift, the number of rooms kept and the total cost.
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    str_date = query_date.strftime("%Y-%m-%d")
+    controls = inputs['controls']
+    nurses_per_control = historic.calculate_nurses_per_control(len(nurses), controls)
+    rooms_per_control = historic.number_rooms_per_nurses_per_control(controls, nurses_per_control, query_shift)
+
+    # Shifts with the same number of nurses per control get the same room groups
+    key = tuple((control, tuple(counts)) for control, counts in rooms_per_control.items())
+    if key not in distributions:
+        occupied_rooms = {control: list(control_dict.values()) for control, control_dict in controls.items()}
+        distributions[key] = distribute_rooms(occupied_rooms, rooms_per_control, str_date, query_shift, SkipRender())
+    all_groups = extract_and_assign_groups(distributions[key])
+
+    room_index = day['rooms']
+    membership = group_membership(all_groups, room_index)
+    rows = [day['nurses'][nurse] for nurse in nurses]
+    cost_matrix = day['cost'][rows] @ membership
+    treatments_matrix = day['treatments'][rows] @ membership
+
+    kept = np.zeros((len(nurses), len(room_index)))
+    for i, nurse in enumerate(nurses):
+        for room in held.get(nurse, ()):
+            if room in room_index:
+                kept[i, room_index[room]] = 1
+    continuity_matrix = kept @ membership
+
+    weights = continuity_weights(cost_matrix, treatments_matrix, continuity_matrix, weight)
+    with stage('continuity.hungarian'):
+        row_ind, col_ind = linear_sum_assignment(weights)
+
+    group_keys = list(all_groups.keys())
+    mapping, rooms_held = {}, {}
+    for i, j in zip(row_ind, col_ind):
+        mapping[group_keys[j]] = (nurses[i], int(cost_matrix[i][j]), int(treatments_matrix[i][j]))
+        rooms_held[nurses[i]] = all_groups[group_keys[j]]
+    kept_rooms = int(continuity_matrix[row_ind, col_ind].sum())
+    total_cost = int(cost_matrix[row_ind, col_ind].sum())
+    return format_mapping(mapping, all_groups), rooms_held, kept_rooms, total_cost
+
+def plan_continuity(start, end, shifts=SHIFTS, weight=None):
+    """ Yield the assignation of every shift from start to end in order, as a rolling horizon.
+
+    Each shift is solved knowing the rooms that the nurses coming from the previous shift (double
+    shifts like M;T or T;N, or N then M) had, so they keep them when their history allows it. The
+    history and pair costs are computed once per date and the room groups reused between shifts.
+    """
+    weight = continuity_weight if weight is None else weight
+    dates = date_range(start, end)
+    inputs = load_batch_inputs(dates)
+
+    previous, held, distributions = None, {}, {}
+    for query_date in dates:
+        str_date = query_date.strftime("%Y-%m-%d")
+        roster = inputs['rosters'][query_date.strftime("%Y-%m")]
+        shift_nurses = {query_shift: get_nurse_shift(query_date, query_shift, roster)[2] for query_shift in shifts}
+        day_nurses = sorted({nurse for nurses in shift_nurses.values() for nurse in nurses})
+        day = None
+
+        for query_shift in shifts:
+            current = (query_date, query_shift)
+            nurses = shift_nurses[query_shift]
+            result = {'date': str_date, 'shift': query_shift}
+            rooms_held = {}
+            try:
+                with request_context(date=str_date, shift=query_shift), stage('continuity.solve'):
+                    if not nurses:
+                        result['error'] = 'No hay enfermeras en el turno'
+                    else:
+                        if day is None:
+                            day = day_pairs(query_date, day_nurses, inputs)
+                        previous_held = held if follows(previous, current) else {}
+                        result['data'], rooms_held, result['continuity'], result['cost'] = solve_shift(
+                            query_date, query_shift, nurses, inputs, day, distributions, previous_held, weight
+                        )
+            except Exception as e:
+                print(f"[WARN]: Error en la asignación del {str_date}, turno {query_shift}: {e}")
+                result['error'] = str(e)
+            previous, held = current, rooms_held
+            yield result
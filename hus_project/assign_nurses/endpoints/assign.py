@@ -1,14 +1,22 @@
-import os
 import numpy as np
 import pandas as pd
 from dateutil.relativedelta import relativedelta
-from matplotlib.table import Table
-import matplotlib.pyplot as plt
-from scipy.optimize import linear_sum_assignment
-from . import utils
+from . import utils, visuals
+from .historic import max_patients_per_nurse
+from .joint import search_groups
+from .kbest import k_best_assignments, lexicographic_weights
+from .metrics import stage
+from .render import save_figure
+from .rooms import render_groups
+from .schema import nurse_ids
 
 from django.conf import settings
-save_path = settings.SAVE_PATH
+joint_assignation = settings.JOINT_ASSIGNATION
+joint_time_budget = settings.JOINT_TIME_BUDGET
+joint_max_rounds = settings.JOINT_MAX_ROUNDS
+joint_size_slack = settings.JOINT_SIZE_SLACK
+joint_orphan_cost = settings.JOINT_ORPHAN_COST
+assignation_alternatives = settings.ASSIGNATION_ALTERNATIVES
 
 def extract_and_assign_groups(groups):
     extracted_groups = {}
@@ -21,89 +29,133 @@ def extract_and_assign_groups(groups):
     return extracted_groups
 
 def merge_historial_resume(historic):
-    if 'control_A' in historic and 'control_B' in historic:
-        merged_historial_treatments = pd.concat([historic['control_A'], historic['control_B']], ignore_index=True)
+    """ Concatenate the treatment summaries of every control. """
+    summaries = [summary for summary in historic.values() if summary is not None]
+    if summaries:
+        merged_historial_treatments = pd.concat(summaries, ignore_index=True)
         return merged_historial_treatments
     else:
-        print("Error: Las claves 'control_A' y 'control_B' no están presentes en el diccionario.")
+        print("Error: No hay resúmenes del histórico para ningún control.")
         return None
 
 def count_group_treatments(nurse_id, group, historic):
     count = 0
     for patient_id in group:
         tratamientos = historic[
-            (historic['ID_ENF'] == nurse_id) &
+            (historic['ID_ENF'] == int(nurse_id)) &
             (historic['HABITACION'] == patient_id)
         ]
         count += tratamientos['NUMERO_TRATAMIENTOS'].sum()
     return int(count)
 
+def recency_cost(last_treatment, query_date):
+    """ Cost of a nurse-patient pair given the date of their most recent treatment. """
+    difference = relativedelta(query_date, pd.to_datetime(last_treatment))
+    months = difference.years * 12 + difference.months
+    days = difference.days
+    months = months + (days / 30)
+    if months > 4:
+        return 2
+    elif months > 2:
+        return 1
+    else:
+        return 0
+
 def calculate_cost(group, nurse_id, historic, query_date):
+    """ Per-cell reference implementation of the group cost, see build_cost_matrices. """
     cost = 0
     for patient_id in group:
         row = historic[
-            (historic['ID_ENF'] == nurse_id) &
+            (historic['ID_ENF'] == int(nurse_id)) &
             (historic['HABITACION'] == patient_id)
         ]     
 
         if not row.empty:
-            date_hist = pd.to_datetime(row.iloc[0]['FECHA_TOMA_MÁS_RECIENTE'])
-            difference = relativedelta(query_date, date_hist)
-            months = difference.years * 12 + difference.months
-            days = difference.days
-            months = months + (days / 30)
-            if months > 4:
-                cost += 2  
-            elif months > 2:
-                cost += 1  
-            else:
-                cost += 0  
+            cost += recency_cost(row.iloc[0]['FECHA_TOMA_MÁS_RECIENTE'], query_date)
         else:
             cost += 4
     return cost
 
-def create_branch_schema(nurses, groups, historial_past_treatments, query_date):
-    # Create cost matrix for Hungarian algorithm
-    n = len(nurses)
-    cost_matrix = np.zeros((n, n))
-    
-    # Fill the cost matrix
-    for i, nurse in enumerate(nurses):
-        for j, (group_key, group_values) in enumerate(groups.items()):
-            cost = calculate_cost(group_values, nurse, historial_past_treatments, query_date)
-            treatments = count_group_treatments(nurse, group_values, historial_past_treatments)
-            # Store cost in matrix
-            cost_matrix[i][j] = cost
-
-    # Apply Hungarian algorithm
-    row_ind, col_ind = linear_sum_assignment(cost_matrix)
-    
-    # Create assignment dictionary
-    assignment = {}
-    total_cost = 0
-    total_treatments = 0
-    
-    for i, j in zip(row_ind, col_ind):
-        nurse = nurses[i]
-        group_key = list(groups.keys())[j]
-        group_values = list(groups.values())[j]
-        
-        cost = cost_matrix[i][j]
-        treatments = count_group_treatments(nurse, group_values, historial_past_treatments)
-        
-        assignment[group_key] = (nurse, int(cost), treatments)
-        total_cost += cost
-        total_treatments += treatments
-
-    min_cost_assignments = [(row_ind, assignment, total_cost, total_treatments)]
-
-    if len(min_cost_assignments) == 1:
-        best_assignment = min_cost_assignments[0]
-    else:
-        print("EMPATE DE COSTE")
-        best_assignment = max(min_cost_assignments, key=lambda x: x[3])
+def pair_matrices(nurses, room_index, historic, query_date):
+    """ Recency cost and number of treatments of every (nurse, room) pair, as nurses x rooms arrays.
+
+    room_index maps each room to its column; pairs without history cost 4, as in calculate_cost.
+    """
+    # The summary holds integer nurse IDs, the roster their string form
+    nurse_index = {nurse: i for i, nurse in enumerate(nurse_ids(nurses))}
+    pair_cost = np.full((len(nurses), len(room_index)), 4.0)
+    pair_treatments = np.zeros((len(nurses), len(room_index)))
+
+    if historic is not None and not historic.empty:
+        rows = historic['ID_ENF'].map(nurse_index)
+        cols = historic['HABITACION'].map(room_index)
+        valid = (rows.notna() & cols.notna()).to_numpy()
+        rows = rows[valid].astype(int).to_numpy()
+        cols = cols[valid].astype(int).to_numpy()
+
+        np.add.at(pair_treatments, (rows, cols), historic['NUMERO_TRATAMIENTOS'].to_numpy()[valid])
+
+        # Only the first summary row of a pair sets its cost, like row.iloc[0] does
+        first = ~pd.DataFrame({'row': rows, 'col': cols}).duplicated().to_numpy()
+        last_dates = pd.to_datetime(historic['FECHA_TOMA_MÁS_RECIENTE'].to_numpy()[valid][first])
+        buckets = {date: recency_cost(date, query_date) for date in last_dates.unique()}
+        pair_cost[rows[first], cols[first]] = [buckets[date] for date in last_dates]
+
+    return pair_cost, pair_treatments
+
+def group_membership(groups, room_index):
+    """ Room x group matrix counting the rooms of every group. """
+    membership = np.zeros((len(room_index), len(groups)))
+    for j, group_values in enumerate(groups.values()):
+        for room in group_values:
+            membership[room_index[room], j] += 1
+    return membership
+
+def build_cost_matrices(nurses, groups, historic, query_date):
+    """ Build the nurse x group cost and treatment matrices with a single pass over the historic summary.
+
+    The summary is pivoted into (nurse, room) arrays holding the recency cost and the
+    number of treatments of every pair, and both matrices are then obtained by
+    multiplying those arrays by the room x group membership matrix.
+    """
+    room_index = {}
+    for group_values in groups.values():
+        for room in group_values:
+            room_index.setdefault(room, len(room_index))
+
+    pair_cost, pair_treatments = pair_matrices(nurses, room_index, historic, query_date)
+    membership = group_membership(groups, room_index)
+    cost_matrix = pair_cost @ membership
+    treatments_matrix = pair_treatments @ membership
+    return cost_matrix, treatments_matrix
+
+def rank_branch_schemas(nurses, groups, historial_past_treatments, query_date, k=1):
+    """ The k best assignments of nurses to groups, best first: lowest total cost, then most treatments
+    of the nurses with their patients. Each is (mapping, total cost, total treatments).
+    """
+    # Create cost and treatment matrices for Hungarian algorithm
+    with stage('assign_nurses.cost_matrix'):
+        cost_matrix, treatments_matrix = build_cost_matrices(nurses, groups, historial_past_treatments, query_date)
+
+    # Cost ties are broken by the treatments inside the same Hungarian solve
+    weights = lexicographic_weights(cost_matrix, treatments_matrix)
+    with stage('assign_nurses.hungarian'):
+        assignments = k_best_assignments(weights, k)
+
+    group_keys = list(groups.keys())
+    ranked = []
+    for row_ind, col_ind, _ in assignments:
+        mapping = {}
+        for i, j in zip(row_ind, col_ind):
+            mapping[group_keys[j]] = (nurses[i], int(cost_matrix[i][j]), int(treatments_matrix[i][j]))
+        ranked.append((
+            mapping, int(cost_matrix[row_ind, col_ind].sum()), int(treatments_matrix[row_ind, col_ind].sum())
+        ))
+    return ranked
 
-    best_perm, best_mapping, best_cost, best_treatments = best_assignment
+def create_branch_schema(nurses, groups, historial_past_treatments, query_date):
+    """ Assignment of nurses to groups with the lowest cost and, among those, the most treatments. """
+    best_mapping, _, _ = rank_branch_schemas(nurses, groups, historial_past_treatments, query_date)[0]
     return best_mapping
 
 def format_mapping(mapping, rooms_lists): 
@@ -118,9 +170,17 @@ def format_mapping(mapping, rooms_lists):
             mapping[f"Grupo {group[1:]}"] = mapping.pop(group)
     return mapping
 
-def create_table(mapping, query_date, query_shift):
-    output_path = os.path.join(save_path, 'table.png')
-    fig, ax = plt.subplots(figsize=(10, 6)) 
+@stage('render.table')
+def create_table(mapping, query_date, query_shift, output_dir=None, mode='png'):
+    if mode != 'png':
+        data = visuals.table_data(mapping, query_date, query_shift)
+        return visuals.save_visual('table', data, visuals.table_svg, mode, output_dir)
+
+    from matplotlib.figure import Figure
+    from matplotlib.table import Table
+
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
     ax.axis('off')
     table = Table(ax, bbox=[0, 0, 1, 1])
     headers = ['Grupo', 'ID Enfermera', 'Habitaciones', 'Nº Pacientes']
@@ -139,18 +199,57 @@ def create_table(mapping, query_date, query_shift):
     ax.add_table(table)
     ax.set_axis_off()
     query_shift = utils.parse_shift(query_shift)
-    plt.title(f'Tabla de asignación de enfermeras para el turno {query_shift} del {query_date}')
-    plt.savefig(output_path, bbox_inches='tight')
-
-def assign_nurses(distributed_rooms, nurses_list, historic, query_date, str_date, query_shift):
-    # Get a dict of all rooms dictionaries
-    all_groups = extract_and_assign_groups(distributed_rooms)
-
+    ax.set_title(f'Tabla de asignación de enfermeras para el turno {query_shift} del {query_date}')
+    return save_figure(fig, 'table.png', output_dir, bbox_inches='tight')
+
+def joint_groups(distributed_rooms, nurses, historial_past_treatments, query_date, query_shift):
+    """ Groups of distribute_rooms with their boundaries moved by search_groups for these nurses. """
+    room_index = {}
+    for groups in distributed_rooms.values():
+        for group in groups.values():
+            for room in group:
+                room_index.setdefault(room, len(room_index))
+    pair_cost, _ = pair_matrices(nurses, room_index, historial_past_treatments, query_date)
+    groups, _ = search_groups(
+        distributed_rooms, pair_cost, room_index, max_patients_per_nurse(query_shift), joint_time_budget,
+        joint_max_rounds, joint_size_slack, joint_orphan_cost
+    )
+    return groups
+
+def assign_nurses(distributed_rooms, nurses_list, historic, query_date, str_date, query_shift, render_job=None, alternatives=None):
+    """ Assign the nurses to the groups of distributed_rooms and draw the table of the best assignment.
+
+    When alternatives is a list, the next ASSIGNATION_ALTERNATIVES best assignments are appended to it
+    as {'data', 'cost', 'treatments'}, formatted like the result.
+    """
     # Merge historic data form 
     historial_past_treatments = merge_historial_resume(historic)
-    best_mapping = create_branch_schema(nurses_list, all_groups, historial_past_treatments, query_date)
 
-    create_table(format_mapping(best_mapping, all_groups), str_date, query_shift)
+    # Joint mode: choose the group boundaries together with the nurses, then draw the final groups
+    if joint_assignation:
+        with stage('assign_nurses.joint_search'):
+            distributed_rooms = joint_groups(distributed_rooms, nurses_list, historial_past_treatments, query_date, query_shift)
+        render_groups(distributed_rooms, str_date, query_shift, render_job)
+
+    # Get a dict of all rooms dictionaries
+    all_groups = extract_and_assign_groups(distributed_rooms)
+    if alternatives is None:
+        best_mapping = create_branch_schema(nurses_list, all_groups, historial_past_treatments, query_date)
+    else:
+        ranked = rank_branch_schemas(
+            nurses_list, all_groups, historial_past_treatments, query_date, assignation_alternatives + 1
+        )
+        best_mapping = ranked[0][0]
+        alternatives.extend(
+            {'data': format_mapping(mapping, all_groups), 'cost': cost, 'treatments': treatments}
+            for mapping, cost, treatments in ranked[1:]
+        )
+
+    best_mapping = format_mapping(best_mapping, all_groups)
+    if render_job is not None:
+        render_job.submit(create_table, dict(best_mapping), str_date, query_shift)
+    else:
+        create_table(best_mapping, str_date, query_shift)
 
     return best_mapping
     
\ No newline at end of file
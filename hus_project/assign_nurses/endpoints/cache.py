@@ -0,0 +1,99 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+def file_signature(path):
+    """ Identify the current version of a file by its modification time and size. """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+class FileCache:
+    """ Process-wide cache of values derived from files, invalidated when any source file changes. """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, paths, loader):
+        """ Return the cached value for key, calling loader() if one of the paths changed since it was built. """
+        signature = tuple(file_signature(path) for path in paths)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+
+        value = loader()
+        with self._lock:
+            self._entries[key] = (signature, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# Content digests of input files, recomputed only when a file's signature changes
+digest_cache = FileCache()
+
+def file_digest(path):
+    """ SHA-256 of a file's content, or None if the file does not exist. """
+    def digest():
+        sha = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+    try:
+        return digest_cache.get(str(path), [path], digest)
+    except FileNotFoundError:
+        return None
+
+class ResultCache:
+    """ Bounded LRU cache of computed results, with an optional pickle tier on disk. """
+
+    def __init__(self, max_entries, disk_path=None):
+        self.max_entries = max_entries
+        self.disk_path = Path(disk_path) if disk_path else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _disk_file(self, key):
+        return self.disk_path / f"{hashlib.sha256(repr(key).encode()).hexdigest()}.pkl"
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if self.disk_path is None:
+            return None
+        try:
+            with open(self._disk_file(key), 'rb') as file:
+                value = pickle.load(file)
+        except (FileNotFoundError, pickle.UnpicklingError, EOFError):
+            return None
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.disk_path is not None:
+            self.disk_path.mkdir(parents=True, exist_ok=True)
+            disk_file = self._disk_file(key)
+            tmp_file = disk_file.with_suffix('.tmp')
+            with open(tmp_file, 'wb') as file:
+                pickle.dump(value, file)
+            os.replace(tmp_file, disk_file)
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,120 +1,278 @@
+import numpy as np
 import pandas as pd
 from datetime import timedelta
 
+from django.db import DatabaseError
+
+from . import history_store
+from .cache import FileCache
+from .layout import load_layout
+from .metrics import stage
+from .schema import BED_INDEX_COLUMNS, DATE_DTYPE, ID_DTYPE, empty_resume, nurse_ids, split_bed, typed_resume
+from .snapshots import iter_workbook_chunks, read_workbook
+
 from django.conf import settings
 file_hosp = settings.FILE_HOSP
 file_historic = settings.FILE_HISTORIC
+file_controls = settings.FILE_CONTROLS
+use_history_store = settings.HISTORY_STORE
 
-def extract_patient_bed(file_path):
-    df = pd.read_excel(file_path)
-    df_4thfloor = df[df['CAMA'].astype(str).str.startswith('4')]
-    beds_and_patients = df_4thfloor[['CAMA', 'ID_PACIENTE']].values.tolist()
-    beds_and_patients.sort(key=lambda x: (int(''.join(filter(str.isdigit, str(x[0])))), str(x[0])))
-    patient_bed_mapping = {patient[1]: patient[0] for patient in beds_and_patients}
-    control_a, control_b = {}, {}
-    for patient_id, bed in patient_bed_mapping.items():
-        bed_number = int(''.join(filter(str.isdigit, bed)))
-        if bed_number < 431:
-            control_a[patient_id] = bed
-        else:
-            control_b[patient_id] = bed
-    return control_a, control_b
-
-def calculate_nurses_per_control(total_nurses, control_a_dict, control_b_dict):
-    patients_in_a = len(control_a_dict)
-    patients_in_b = len(control_b_dict)
-    total_patients = patients_in_a + patients_in_b
-    nurses_in_a = round((patients_in_a / total_patients) * total_nurses)
-    nurses_in_b = total_nurses - nurses_in_a
-    return {"control_A": nurses_in_a, "control_B": nurses_in_b}
-
-def number_rooms_per_nurses_per_control(control_a_dict, control_b_dict, nurses_per_control, shift):
-    if shift in ["M", "T"]:
-        max_patients_per_nurse = 11
-    elif shift == "N":
-        max_patients_per_nurse = 17
-    else:
+HISTORY_COLUMNS = ['ID_ENF', 'ID_PACIENTE', 'FECHA_TOMA']
+
+# Admissions index and admissions per control, and history rows of the admitted patients, rebuilt when their files change
+admissions_cache = FileCache()
+history_cache = FileCache()
+
+def admissions_index(file_path, control_path):
+    """ Typed index of the patients admitted in beds of controls.json: bed, its number and suffix, control and
+    position in the bed order of the floor layout. Sorted by bed and indexed by patient.
+    """
+    layout = load_layout(control_path)
+    df = read_workbook(file_path).dropna(subset=['ID_PACIENTE'])
+    beds = df['CAMA'].astype(str)
+    # Snapshots already hold the split bed columns
+    number, suffix = (df['CAMA_NUMERO'], df['CAMA_SUFIJO']) if 'CAMA_NUMERO' in df else split_bed(beds)
+    index = pd.DataFrame({
+        'ID_PACIENTE': df['ID_PACIENTE'].astype(ID_DTYPE),
+        'CAMA': beds,
+        'CAMA_NUMERO': number,
+        'CAMA_SUFIJO': suffix,
+        'CONTROL': pd.Categorical(beds.map(layout.bed_controls), categories=layout.controls),
+        'POSICION': beds.map(layout.index),
+    }, columns=BED_INDEX_COLUMNS)
+    index = index[index['POSICION'].notna()].astype({'POSICION': 'int64'}).sort_values('POSICION', kind='stable')
+    # A patient listed twice keeps the last of their beds in bed order, not in the file
+    index = index.drop_duplicates('ID_PACIENTE', keep='last')
+    return index.set_index('ID_PACIENTE', drop=False)
+
+def patient_beds(index, control_path):
+    """ Map the patients of an admissions index to their beds, per control of controls.json, in bed order. """
+    controls = {control: {} for control in dict.fromkeys(load_layout(control_path).bed_controls.values())}
+    for control, patient_id, bed in zip(index['CONTROL'], index['ID_PACIENTE'].tolist(), index['CAMA']):
+        controls[control][patient_id] = bed
+    return controls
+
+def extract_patient_bed(file_path, control_path):
+    """ Map the admitted patients to their beds, per control of controls.json, sorted by bed. """
+    return patient_beds(admissions_index(file_path, control_path), control_path)
+
+def load_admissions_index():
+    """ admissions_index of the configured files, from the process-wide cache. The index is shared, don't modify it. """
+    return admissions_cache.get(
+        ('index', str(file_hosp), str(file_controls)), [file_hosp, file_controls],
+        lambda: admissions_index(file_hosp, file_controls)
+    )
+
+def load_admissions():
+    """ extract_patient_bed of the configured files, from the process-wide cache. The result is shared, don't modify it. """
+    return admissions_cache.get(
+        ('controls', str(file_hosp), str(file_controls)), [file_hosp, file_controls],
+        lambda: patient_beds(load_admissions_index(), file_controls)
+    )
+
+def calculate_nurses_per_control(total_nurses, controls):
+    """ Share the nurses among the controls in proportion to their patients.
+
+    Rounding the cumulative shares keeps the total and gives the same split as rounding
+    the first control's share when there are two controls.
+    """
+    patients = [len(control_dict) for control_dict in controls.values()]
+    total_patients = sum(patients)
+    nurses_per_control, assigned, cumulative = {}, 0, 0
+    for control, n_patients in zip(controls, patients):
+        cumulative += n_patients
+        nurses_until_here = round((cumulative / total_patients) * total_nurses)
+        nurses_per_control[control] = nurses_until_here - assigned
+        assigned = nurses_until_here
+
+    # Every control with patients needs at least one nurse
+    for control, n_patients in zip(controls, patients):
+        if n_patients and not nurses_per_control[control]:
+            donor = max(nurses_per_control, key=nurses_per_control.get)
+            if nurses_per_control[donor] > 1:
+                nurses_per_control[donor] -= 1
+                nurses_per_control[control] += 1
+    return nurses_per_control
+
+MAX_PATIENTS_PER_NURSE = {'M': 11, 'T': 11, 'N': 17}
+
+def max_patients_per_nurse(shift):
+    """ Most patients a nurse should have in a shift. """
+    try:
+        return MAX_PATIENTS_PER_NURSE[shift]
+    except KeyError:
         raise ValueError("Turno no válido. Debe ser 'M', 'T' o 'N'.")
-    
+
+def number_rooms_per_nurses_per_control(controls, nurses_per_control, shift):
+    max_patients = max_patients_per_nurse(shift)
+
     def divide(control_dict, nurses):
+        if nurses == 0:
+            return []
         total = len(control_dict)
         base = total // nurses
         remainder = total % nurses
         return [base + (1 if i < remainder else 0) for i in range(nurses)]
 
-    rooms_count_a = divide(control_a_dict, nurses_per_control['control_A'])
-    rooms_count_b = divide(control_b_dict, nurses_per_control['control_B'])
+    rooms_per_control = {
+        control: divide(control_dict, nurses_per_control[control]) for control, control_dict in controls.items()
+    }
 
-    if any(count > max_patients_per_nurse for count in rooms_count_a + rooms_count_b):
+    if any(count > max_patients for counts in rooms_per_control.values() for count in counts):
         print("⚠️  Falta personal: Hay enfermeras con más pacientes del límite permitido.")
 
-    return {"control_A": rooms_count_a, "control_B": rooms_count_b}
+    return rooms_per_control
 
-def treatment_historial(filepath, control_a_dict, control_b_dict, nurses_shift, current_date):
-    historic_df = pd.read_excel(filepath)
-    historic_df['FECHA_TOMA'] = pd.to_datetime(historic_df['FECHA_TOMA'], errors='coerce')
+def sort_by_room(resume, control_dict):
+    """ Attach the bed of each patient to the summary and sort it by bed number and suffix. """
+    resume['HABITACION'] = resume['ID_PACIENTE'].map(control_dict)
+    # control_dict is already in bed order (extract_patient_bed), so the position of a patient is its rank
+    rank = {patient: position for position, patient in enumerate(control_dict)}
+    return resume.iloc[resume['ID_PACIENTE'].map(rank).to_numpy().argsort(kind='stable')]
 
-    def proccess_historial(control_dict, historic_df, current_date):
-        try:
-            
-            historic_df['ID_ENF'] = historic_df['ID_ENF'].fillna(0).astype(int).astype(str)
-            historic_df['ID_PACIENTE'] = historic_df['ID_PACIENTE'].astype(int)  
-            mask = historic_df['ID_PACIENTE'].isin(control_dict) & historic_df['ID_ENF'].isin(nurses_shift)
-            historic = historic_df.loc[mask].copy()
-            historic = historic[historic['ID_ENF'].isin(nurses_shift)]
-
-            historic['ID_ENF'] = (
-                historic['ID_ENF']
-                .fillna(0)
-                .astype(int)
-                .astype(str)
-            )
+def split_by_control(resume, controls, bed_index=None):
+    """ Split a summary of all the controls into one summary per control, sorted by bed.
 
-            historic['FECHA_TOMA'] = pd.to_datetime(historic['FECHA_TOMA'], errors= 'coerce').dt.date
-            limit_date = current_date - timedelta(days=6*30)  # Last 6 months filter
-            historic = historic[
-                (historic['FECHA_TOMA'] >= limit_date) & 
-                (historic['FECHA_TOMA'] <= current_date)  
-            ]
-            
-            agg_funcs = {'ID_ENF': 'count', 'FECHA_TOMA': 'max'}
-            resume = historic.groupby(['ID_ENF', 'ID_PACIENTE']).agg(agg_funcs).rename(
-                columns={'ID_ENF': 'NUMERO_TRATAMIENTOS', 'FECHA_TOMA': 'FECHA_TOMA_MÁS_RECIENTE'}
-            ).reset_index()
-            
-            resume['HABITACION'] = resume['ID_PACIENTE'].map(control_dict)
-            
-            resume['HABITACION_ORDEN'] = resume['HABITACION'].apply(
-                lambda x: (int(''.join(filter(str.isdigit, x))), ''.join(filter(str.isalpha, x))))
-            resume = resume.sort_values(by='HABITACION_ORDEN').drop(columns=['HABITACION_ORDEN'])
-            return resume
-        
-        except Exception as e:
-            print(f"Error al leer el archivo: {e}")
-            return None
-        
-    historic_a = proccess_historial(control_a_dict, historic_df, current_date)
-    historic_b = proccess_historial(control_b_dict, historic_df, current_date)
-    return {'control_A': historic_a, 'control_B': historic_b }
+    With the admissions index of the controls, beds, controls and order come from joins on the patient.
+    """
+    if bed_index is None:
+        return {
+            control: sort_by_room(resume[resume['ID_PACIENTE'].isin(control_dict)].copy(), control_dict)
+            for control, control_dict in controls.items()
+        }
 
-def get_historic(current_date, shift, shift_nurses):
-    # Mapping of patients IDs to beds numbers for controls A and B
-    control_a_dict, control_b_dict = extract_patient_bed(file_hosp)
+    # Row of every patient of the summary in the index, which is in bed order; -1 for patients not admitted
+    rows = bed_index.index.get_indexer(resume['ID_PACIENTE'])
+    order = np.flatnonzero(rows >= 0)
+    order = order[rows[order].argsort(kind='stable')]
+    rows = rows[order]
+    resume = resume.iloc[order].copy()
+    resume['HABITACION'] = bed_index['CAMA'].to_numpy()[rows]
+    codes = bed_index['CONTROL'].cat.codes.to_numpy()[rows]
+    categories = bed_index['CONTROL'].cat.categories
+    return {control: resume.iloc[np.flatnonzero(codes == categories.get_loc(control))] for control in controls}
 
-    # Get rooms division based on the number of nurses
-    total_nurses = len(shift_nurses)
-    nurses_per_control = calculate_nurses_per_control(total_nurses, control_a_dict, control_b_dict)
-    rooms_per_control = number_rooms_per_nurses_per_control(control_a_dict, control_b_dict, nurses_per_control, shift)
+def stored_treatment_historial(filepath, controls, nurses_shift, current_date, bed_index=None):
+    """ Same summary as treatment_historial, answered by the indexed history store. """
+    new_rows = history_store.sync_history(filepath)
+    if new_rows:
+        print(f"[INFO]: {new_rows} filas nuevas añadidas al histórico")
 
-    # Generate summaries of treatments by nurse for both controls A and B
-    historial_resume_a_b = treatment_historial(file_historic, control_a_dict, control_b_dict, shift_nurses, current_date)
+    limit_date = current_date - timedelta(days=6*30)  # Last 6 months filter
+    patients = [patient for control_dict in controls.values() for patient in control_dict]
+    resume = history_store.query_resume(nurses_shift, patients, limit_date, current_date)
+    return split_by_control(resume, controls, bed_index)
 
-    # Generate a list of occupied rooms for each control
-    occupied_rooms_per_control = {"control_A": list(control_a_dict.values()),"control_B": list(control_b_dict.values())}
+def clean_history_chunk(chunk):
+    """ Cast a chunk of history rows to integer IDs and treatment days, dropping rows without patient. """
+    chunk = chunk.dropna(subset=['ID_PACIENTE'])
+    return pd.DataFrame({
+        'ID_ENF': chunk['ID_ENF'].fillna(0).astype(ID_DTYPE),
+        'ID_PACIENTE': chunk['ID_PACIENTE'].astype(ID_DTYPE),
+        'FECHA_TOMA': pd.to_datetime(chunk['FECHA_TOMA'], errors='coerce').dt.normalize().astype(DATE_DTYPE),
+    })
+
+def iter_history_chunks(filepath):
+    return map(clean_history_chunk, iter_workbook_chunks(filepath, HISTORY_COLUMNS))
+
+def fold_history(chunks, nurses_shift, patients, limit_date, current_date):
+    """ Treatments count and latest treatment date per (nurse, patient) inside the date window.
+
+    Every chunk is filtered and aggregated before the next one is read, so memory holds one
+    chunk and the aggregate instead of the whole history.
+    """
+    nurses = nurse_ids(nurses_shift)
+    window_start, window_end = pd.Timestamp(limit_date), pd.Timestamp(current_date)
+    resume = None
+    for chunk in chunks:
+        mask = (
+            chunk['ID_ENF'].isin(nurses) & chunk['ID_PACIENTE'].isin(patients)
+            & chunk['FECHA_TOMA'].between(window_start, window_end)
+        )
+        part = chunk.loc[mask].groupby(['ID_ENF', 'ID_PACIENTE'])['FECHA_TOMA'].agg(['size', 'max'])
+        if resume is not None:
+            part = pd.concat([resume, part]).groupby(level=[0, 1]).agg({'size': 'sum', 'max': 'max'})
+        resume = part
+
+    if resume is None:
+        return empty_resume()
+    resume = resume.reset_index().rename(columns={'size': 'NUMERO_TRATAMIENTOS', 'max': 'FECHA_TOMA_MÁS_RECIENTE'})
+    return typed_resume(resume)
+
+def load_history(filepath, patients):
+    """ History rows of the given patients, filtered while the file is read. """
+    parts = [chunk[chunk['ID_PACIENTE'].isin(patients)] for chunk in iter_history_chunks(filepath)]
+    return pd.concat(parts, ignore_index=True) if parts else None
+
+def treatment_historial(filepath, controls, nurses_shift, current_date, historic_df=None, bed_index=None):
+    """ Treatments summary of the nurses with the admitted patients of controls, one per control sorted by bed.
+    bed_index, the admissions index the controls come from, avoids rebuilding the bed order from them.
+    """
+    if historic_df is None and use_history_store:
+        try:
+            return stored_treatment_historial(filepath, controls, nurses_shift, current_date, bed_index)
+        except DatabaseError as e:
+            print(f"[WARN]: Almacén del histórico no disponible ({e}), leyendo {filepath}")
+
+    limit_date = current_date - timedelta(days=6*30)  # Last 6 months filter
+    patients = [patient for control_dict in controls.values() for patient in control_dict]
+    # Batch plans pass the history already read; otherwise the file is streamed in chunks
+    chunks = [historic_df] if historic_df is not None else iter_history_chunks(filepath)
+    try:
+        resume = fold_history(chunks, nurses_shift, patients, limit_date, current_date)
+    except (KeyError, TypeError, ValueError) as e:
+        print(f"Error al leer el archivo: {e}")
+        return {control: None for control in controls}
+    return split_by_control(resume, controls, bed_index)
 
-    return occupied_rooms_per_control, rooms_per_control, historial_resume_a_b
+def load_inputs():
+    """ Admissions and treatment history shared by every shift of a batch plan or request.
 
+    The history is only read here when the store is off; otherwise each shift queries the store.
+    """
+    controls = load_admissions()
+    beds = load_admissions_index()
+    history = None
+    if use_history_store:
+        # Ingest new rows now, so the queries of the shifts only read the store
+        try:
+            new_rows = history_store.sync_history(file_historic)
+            if new_rows:
+                print(f"[INFO]: {new_rows} filas nuevas añadidas al histórico")
+        except (DatabaseError, OSError) as e:
+            print(f"[WARN]: No se pudo actualizar el almacén del histórico ({e})")
+    else:
+        # Only the rows of admitted patients can ever reach a summary
+        patients = [patient for control_dict in controls.values() for patient in control_dict]
+        try:
+            history = history_cache.get(
+                (str(file_historic), str(file_hosp), str(file_controls)), [file_historic, file_hosp, file_controls],
+                lambda: load_history(file_historic, patients)
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Error al leer el archivo: {e}")
+    return {'controls': controls, 'beds': beds, 'history': history}
 
+def get_historic(current_date, shift, shift_nurses, inputs=None):
+    # Mapping of patients IDs to beds numbers for every control of controls.json
+    if inputs is None:
+        with stage('get_historic.load_admissions'):
+            controls = load_admissions()
+            beds = load_admissions_index()
+        history = None
+    else:
+        controls, beds, history = inputs['controls'], inputs.get('beds'), inputs['history']
 
+    # Get rooms division based on the number of nurses
+    total_nurses = len(shift_nurses)
+    nurses_per_control = calculate_nurses_per_control(total_nurses, controls)
+    rooms_per_control = number_rooms_per_nurses_per_control(controls, nurses_per_control, shift)
 
+    # Generate summaries of treatments by nurse for every control
+    with stage('get_historic.treatment_historial'):
+        historial_resume = treatment_historial(file_historic, controls, shift_nurses, current_date, history, beds)
+
+    # Generate a list of occupied rooms for each control
+    occupied_rooms_per_control = {control: list(control_dict.values()) for control, control_dict in controls.items()}
 
+    return occupied_rooms_per_control, rooms_per_control, historial_resume
@@ -0,0 +1,70 @@
+import pandas as pd
+from django.db import connection, transaction
+from django.db.models import Max, Sum
+
+from .cache import file_signature
+from .schema import RESUME_COLUMNS, nurse_ids, typed_resume
+from .snapshots import read_workbook
+from ..models import HistoryIngestion, TreatmentDay
+
+def aggregate_days(historic_df):
+    """ Fold history rows into treatments per (nurse, patient, day). """
+    days = pd.DataFrame({
+        'nurse_id': historic_df['ID_ENF'].fillna(0).astype(int),
+        'patient_id': historic_df['ID_PACIENTE'].astype(int),
+        'fecha_toma': pd.to_datetime(historic_df['FECHA_TOMA'], errors='coerce').dt.date,
+    }).dropna(subset=['fecha_toma'])
+    return days.groupby(['nurse_id', 'patient_id', 'fecha_toma']).size().reset_index(name='treatments')
+
+def upsert_days(days):
+    """ Add the daily counts to the store, summing with the counts already present. """
+    table = TreatmentDay._meta.db_table
+    sql = (
+        f"INSERT INTO {table} (nurse_id, patient_id, fecha_toma, treatments) VALUES (%s, %s, %s, %s) "
+        f"ON CONFLICT (nurse_id, patient_id, fecha_toma) DO UPDATE SET treatments = {table}.treatments + excluded.treatments"
+    )
+    params = [(int(n), int(p), d, int(t)) for n, p, d, t in days.itertuples(index=False)]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+def sync_history(filepath):
+    """ Ingest the rows appended to the history file since the last sync. Returns the number of new rows. """
+    mtime_ns, size = file_signature(filepath)
+    ingestion, _ = HistoryIngestion.objects.get_or_create(source=str(filepath))
+    if (ingestion.mtime_ns, ingestion.size) == (mtime_ns, size):
+        return 0
+
+    historic_df = read_workbook(filepath)
+    # History only grows by appending; a shorter file means it was rewritten
+    rewritten = len(historic_df) < ingestion.rows
+    new_rows = historic_df.iloc[0 if rewritten else ingestion.rows:]
+    with transaction.atomic():
+        # Advancing the watermark from the one read above is the first write, so it takes the write lock.
+        # A concurrent sync that advanced it first leaves no row to update, and its rows are not added again
+        advanced = HistoryIngestion.objects.filter(
+            pk=ingestion.pk, rows=ingestion.rows, mtime_ns=ingestion.mtime_ns, size=ingestion.size
+        ).update(rows=len(historic_df), mtime_ns=mtime_ns, size=size)
+        if not advanced:
+            return 0
+        if rewritten:
+            TreatmentDay.objects.all().delete()
+        upsert_days(aggregate_days(new_rows))
+    return len(new_rows)
+
+def query_resume(nurses_shift, patients, limit_date, current_date):
+    """ Treatments count and latest treatment date per (nurse, patient) inside the date window. """
+    rows = (
+        TreatmentDay.objects
+        .filter(
+            nurse_id__in=nurse_ids(nurses_shift),
+            patient_id__in=[int(patient) for patient in patients],
+            fecha_toma__range=(limit_date, current_date),
+        )
+        .values('nurse_id', 'patient_id')
+        .annotate(NUMERO_TRATAMIENTOS=Sum('treatments'), FECHA_TOMA_MÁS_RECIENTE=Max('fecha_toma'))
+        .order_by()
+    )
+    resume = pd.DataFrame.from_records(
+        list(rows), columns=['nurse_id', 'patient_id'] + RESUME_COLUMNS[2:]
+    ).rename(columns={'nurse_id': 'ID_ENF', 'patient_id': 'ID_PACIENTE'})
+    return typed_resume(resume)
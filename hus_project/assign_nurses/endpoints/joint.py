@@ -0,0 +1,125 @@
+import random
+import time
+
+import numpy as np
+
+from .layout import pair_positions
+
+# Joint search of the room groups and the nurse assignment. The groups of each control stay
+# contiguous runs of its rooms in bed order; the search moves the boundaries between them and
+# solves the assignment of every candidate, scoring assignment cost plus orphaned 'B' beds.
+
+class GroupSearch:
+    """ Cost of any set of group boundaries for the nurses of a shift, from prefix sums of the pair costs.
+
+    groups_lists is the grouping of distribute_rooms ({control: {i: rooms}}, rooms in bed order),
+    pair_cost the nurses x rooms costs of pair_matrices with room_index its columns.
+    """
+
+    def __init__(self, groups_lists, pair_cost, room_index, orphan_cost):
+        self.controls = list(groups_lists)
+        self.rooms = [[room for group in groups.values() for room in group] for groups in groups_lists.values()]
+        self.pairs = [pair_positions(rooms) for rooms in self.rooms]
+        self.prefix = [
+            np.hstack([np.zeros((len(pair_cost), 1)), np.cumsum(pair_cost[:, [room_index[room] for room in rooms]], axis=1)])
+            for rooms in self.rooms
+        ]
+        self.orphan_cost = orphan_cost
+        self.initial = tuple(tuple(len(group) for group in groups.values()) for groups in groups_lists.values())
+
+    def cost_matrix(self, sizes):
+        """ Nurses x groups cost of every group of the given sizes, controls one after another. """
+        columns = []
+        for prefix, control_sizes in zip(self.prefix, sizes):
+            ends = np.cumsum(control_sizes)
+            columns.append(prefix[:, ends] - prefix[:, ends - control_sizes])
+        return np.hstack(columns)
+
+    def orphans(self, sizes):
+        count = 0
+        for pairs, control_sizes in zip(self.pairs, sizes):
+            start = 0
+            for size in control_sizes:
+                group_pairs = pairs[start:start + size]
+                count += np.count_nonzero((group_pairs < start) | (group_pairs >= start + size))
+                start += size
+        return count
+
+    def score(self, sizes):
+        from scipy.optimize import linear_sum_assignment
+
+        cost_matrix = self.cost_matrix(sizes)
+        row_ind, col_ind = linear_sum_assignment(cost_matrix)
+        return cost_matrix[row_ind, col_ind].sum() + self.orphan_cost * self.orphans(sizes)
+
+    def groups(self, sizes):
+        """ groups_lists with the given sizes. """
+        groups_lists = {}
+        for control, rooms, control_sizes in zip(self.controls, self.rooms, sizes):
+            ends = np.cumsum(control_sizes).tolist()
+            groups_lists[control] = {i: rooms[end - size:end] for i, (size, end) in enumerate(zip(control_sizes, ends))}
+        return groups_lists
+
+def size_limits(sizes, max_patients, slack):
+    """ Smallest and largest group of a control: the even split give or take slack, at most max_patients
+    unless the even split already exceeds it.
+    """
+    if not sizes:
+        return 0, 0
+    low = max(1, min(sizes) - slack) if min(sizes) > 0 else 0
+    high = max(min(max(sizes) + slack, max_patients), max(sizes))
+    return low, high
+
+def moves(sizes, limits):
+    """ Every grouping that moves one boundary between neighbouring groups by one or two rooms, two keeping
+    the beds of a room together.
+    """
+    for c, (control_sizes, (low, high)) in enumerate(zip(sizes, limits)):
+        for k in range(len(control_sizes) - 1):
+            for delta in (2, -2, 1, -1):
+                left, right = control_sizes[k] + delta, control_sizes[k + 1] - delta
+                if low <= left <= high and low <= right <= high:
+                    moved = control_sizes[:k] + (left, right) + control_sizes[k + 2:]
+                    yield sizes[:c] + (moved,) + sizes[c + 1:]
+
+def search_groups(groups_lists, pair_cost, room_index, max_patients, time_budget, max_rounds, slack=2, orphan_cost=4, seed=0):
+    """ Move the group boundaries of groups_lists to lower the assignment cost plus orphan_cost per orphaned bed.
+
+    Iterated local search: first-improvement descent over single boundary moves, then a random kick
+    from the best grouping, for max_rounds rounds or until time_budget seconds pass. The best grouping
+    found so far is returned at any point, and it is never worse than groups_lists.
+    """
+    deadline = time.perf_counter() + time_budget
+    search = GroupSearch(groups_lists, pair_cost, room_index, orphan_cost)
+    limits = [size_limits(sizes, max_patients, slack) for sizes in search.initial]
+    rng = random.Random(seed)
+
+    best = current = search.initial
+    best_score = current_score = search.score(current)
+    rounds = 0
+    while time.perf_counter() < deadline:
+        for candidate in moves(current, limits):
+            candidate_score = search.score(candidate)
+            if candidate_score < current_score:
+                current, current_score = candidate, candidate_score
+                break
+            if time.perf_counter() >= deadline:
+                break
+        else:
+            # Local optimum: keep it if it is the best, then restart from a kick of the best
+            if current_score < best_score:
+                best, best_score = current, current_score
+            if rounds >= max_rounds:
+                break
+            rounds += 1
+            current = best
+            for _ in range(3):
+                options = list(moves(current, limits))
+                if options:
+                    current = rng.choice(options)
+            current_score = search.score(current)
+            continue
+        if current_score < best_score:
+            best, best_score = current, current_score
+
+    return search.groups(best), best_score
@@ -0,0 +1,80 @@
+import heapq
+
+import numpy as np
+
+# Exact tie-breaking and ranking of nurse assignments. Costs and treatments are integers, so
+# "lowest cost, then most treatments" is one integer objective, cost * scale - treatments, that a
+# single Hungarian solve minimizes; the next best assignments come from Murty's partitioning.
+
+# Largest integer float64 holds exactly, the precision linear_sum_assignment works in
+EXACT_LIMIT = 2 ** 53
+
+def lexicographic_weights(cost_matrix, treatments_matrix, primary=None):
+    """ Nurses x groups weights whose minimum assignment has the lowest cost and, among those, the most treatments.
+
+    The cost is scaled beyond any difference of total treatments, so no number of treatments outweighs
+    one unit of cost. primary replaces the cost as the first objective, e.g. with a continuity discount;
+    it must be integer-valued too, as the guarantee needs its differences to be at least one.
+    Falls back to the first objective alone, with a warning, when the weights would lose precision.
+    """
+    primary = np.rint(cost_matrix if primary is None else primary).astype(np.int64)
+    treatments = np.rint(treatments_matrix).astype(np.int64)
+    n = min(primary.shape)
+    scale = int(treatments.max(initial=0)) * n + 1
+    if (float(np.abs(primary).max(initial=0)) + 1) * scale * n >= EXACT_LIMIT:
+        print("[WARN]: Demasiados tratamientos para desempatar el coste de forma exacta, se usa solo el coste")
+        return primary
+    return primary * scale - treatments
+
+def constrained(weights, forced, forbidden):
+    """ weights with the pairs in forbidden removed and the pairs in forced as the only option of their row and column. """
+    constrained_weights = weights.astype(float)
+    for i, j in forced:
+        constrained_weights[i, :] = np.inf
+        constrained_weights[:, j] = np.inf
+        constrained_weights[i, j] = weights[i, j]
+    for i, j in forbidden:
+        constrained_weights[i, j] = np.inf
+    return constrained_weights
+
+def solve(weights, forced=(), forbidden=()):
+    """ Minimum assignment of weights under the constraints as (row_ind, col_ind, total), None if there is none. """
+    from scipy.optimize import linear_sum_assignment
+
+    constrained_weights = constrained(weights, forced, forbidden) if forced or forbidden else weights
+    try:
+        row_ind, col_ind = linear_sum_assignment(constrained_weights)
+    except ValueError:
+        # Every assignment left uses a removed pair
+        return None
+    return row_ind, col_ind, weights[row_ind, col_ind].sum().item()
+
+def k_best_assignments(weights, k):
+    """ The k assignments of lowest total weight, best first, as (row_ind, col_ind, total) (Murty's algorithm).
+
+    Every assignment found splits the ones not yet found into disjoint subproblems, each keeping its
+    first pairs and excluding the next one, so each of the k assignments costs at most one Hungarian
+    solve per group. Ties keep the order in which they are found.
+    """
+    best = solve(weights)
+    if best is None or k < 1:
+        return []
+
+    # Subproblems by the total of their best assignment; the counter breaks ties in order of creation
+    counter = 0
+    queue = [(best[2], counter, best, (), ())]
+    ranked = []
+    while queue and len(ranked) < k:
+        _, _, (row_ind, col_ind, total), forced, forbidden = heapq.heappop(queue)
+        ranked.append((row_ind, col_ind, total))
+        if len(ranked) == k:
+            break
+        free =[(i, j) for i, j in zip(row_ind.tolist(), col_ind.tolist()) if (i, j) not in forced]
+        for position, pair in enumerate(free):
+            sub_forced = forced + tuple(free[:position])
+            sub_forbidden = forbidden + (pair,)
+            solution = solve(weights, sub_forced, sub_forbidden)
+            if solution is not None:
+                counter += 1
+                heapq.heappush(queue, (solution[2], counter, solution, sub_forced, sub_forbidden))
+    return ranked
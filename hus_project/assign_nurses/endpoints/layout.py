@@ -0,0 +1,92 @@
+import json
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .cache import FileCache
+from .schema import bed_order
+
+# Compiled controls.json, rebuilt when the file changes
+layout_cache = FileCache()
+
+def room_order(rooms):
+    """ Positions that sort room labels by bed_order, labels without a bed number last by name. """
+    labels = pd.Series(list(rooms), dtype=object).astype(str)
+    order = bed_order(labels).fillna(np.iinfo(np.int64).max).to_numpy(np.int64)
+    return np.lexsort((labels.to_numpy(), order))
+
+def pair_positions(rooms):
+    """ Position, among the sorted room labels, of the bed each one must share a group with:
+    the partner of a 'B' bed (-1 if it is not among them), or the bed itself.
+    """
+    positions = {room: i for i, room in enumerate(rooms)}
+    return np.array(
+        [positions.get(room[:-1], -1) if room.endswith('B') else i for i, room in enumerate(rooms)], dtype=np.int64
+    )
+
+def orphan_counts(pairs, size, total=None):
+    """ Orphaned 'B' beds of every contiguous group of size beds, by start position.
+
+    A bed is orphaned when the bed of its pair position falls outside its group. Positions up to
+    total are covered, past the end of pairs groups are just shorter.
+    """
+    total = max(total or 0, len(pairs), size)
+    padded = np.concatenate([pairs, np.arange(len(pairs), total)])
+    windows = sliding_window_view(padded, size)
+    starts = np.arange(len(windows))[:, None]
+    return ((windows < starts) | (windows >= starts + size)).sum(axis=1)
+
+class FloorLayout:
+    """ controls.json compiled into arrays of its rooms sorted by bed order.
+
+    For each room: its label, control, coordinates and the position of the bed it pairs with
+    (pair_positions over the whole floor), so occupancy filtering and the orphan check of any
+    grouping algorithm work on positions instead of labels.
+    """
+
+    def __init__(self, data):
+        labels = [room['room'] for rooms in data.values() for room in rooms]
+        order = room_order(labels)
+
+        self.controls = list(data)
+        control_codes = {control: code for code, control in enumerate(self.controls)}
+        self.room = np.array(labels, dtype=object)[order]
+        self.control = np.array([control_codes[control] for control, rooms in data.items() for _ in rooms], dtype=np.int64)[order]
+        self.x = np.array([room['x'] for rooms in data.values() for room in rooms])[order]
+        self.y = np.array([room['y'] for rooms in data.values() for room in rooms])[order]
+        self.pair = pair_positions(self.room.tolist())
+        self.index = {room: position for position, room in enumerate(self.room.tolist())}
+
+        # Views in the order of the file, as the renders and the admissions expect them
+        self.coords = {control: {room['room']: (room['x'], room['y']) for room in rooms} for control, rooms in data.items()}
+        self.bed_controls = {room['room']: control for control, rooms in data.items() for room in rooms}
+
+    @classmethod
+    def from_file(cls, control_path):
+        with open(control_path, 'r') as file:
+            return cls(json.load(file))
+
+    def occupied(self, control, rooms):
+        """ Positions of the given rooms of a control, in bed order. Rooms not in the control are skipped. """
+        code = self.controls.index(control)
+        mask = np.zeros(len(self.room), dtype=bool)
+        mask[[self.index[room] for room in rooms if room in self.index]] = True
+        return np.flatnonzero(mask & (self.control == code))
+
+    def items(self, positions):
+        """ (room, (x, y)) of the rooms at positions, as create_room_groups takes them. """
+        return list(zip(self.room[positions].tolist(), zip(self.x[positions].tolist(), self.y[positions].tolist())))
+
+    def pairs(self, positions):
+        """ pair_positions of the rooms at positions, from the floor table: positions within the selection,
+        -1 for a 'B' bed whose partner is not selected.
+        """
+        local = np.full(len(self.room), -1, dtype=np.int64)
+        local[positions] = np.arange(len(positions))
+        pair = self.pair[positions]
+        return np.where(pair >= 0, local[pair], -1)
+
+def load_layout(control_path):
+    """ FloorLayout of controls.json, from the process-wide cache. The layout is shared, don't modify it. """
+    return layout_cache.get(str(control_path), [control_path], lambda: FloorLayout.from_file(control_path))
@@ -0,0 +1,120 @@
+import asyncio
+import cProfile
+import io
+import json
+import logging
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger('assign_nurses.metrics')
+
+# Upper bounds in seconds of the stage duration histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float('inf'))
+
+# Fields added to every record of the current request (date, shift, ...)
+request_fields = ContextVar('request_fields', default={})
+
+class Histogram:
+    """ Cumulative duration histogram of one stage, in the Prometheus layout. """
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+        self.sum += seconds
+        self.count += 1
+
+histograms = {}
+histograms_lock = threading.Lock()
+
+def observe(stage_name, seconds):
+    with histograms_lock:
+        histograms.setdefault(stage_name, Histogram()).observe(seconds)
+
+@contextmanager
+def request_context(**fields):
+    """ Attach fields like the date and shift to every stage record emitted inside the block. """
+    token = request_fields.set({**request_fields.get(), **fields})
+    try:
+        yield
+    finally:
+        request_fields.reset(token)
+
+@contextmanager
+def stage(name):
+    """ Time a pipeline stage, adding it to the histograms and emitting a JSON log record.
+
+    Also usable as a decorator.
+    """
+    status = 'ok'
+    start = time.perf_counter()
+    try:
+        yield
+    except asyncio.CancelledError:
+        status = 'cancelled'
+        raise
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        observe(name, seconds)
+        record = {'event': 'stage', 'stage': name, 'seconds': round(seconds, 6), 'status': status}
+        logger.info(json.dumps({**record, **request_fields.get()}, default=str))
+
+def render_prometheus():
+    """ Stage histograms in the Prometheus text exposition format. """
+    lines = [
+        '# HELP assignation_stage_seconds Duration of the assignation pipeline stages.',
+        '# TYPE assignation_stage_seconds histogram',
+    ]
+    with histograms_lock:
+        for name, histogram in sorted(histograms.items()):
+            for bound, count in zip(BUCKETS, histogram.buckets):
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'assignation_stage_seconds_bucket{{stage="{name}",le="{le}"}} {count}')
+            lines.append(f'assignation_stage_seconds_sum{{stage="{name}"}} {histogram.sum}')
+            lines.append(f'assignation_stage_seconds_count{{stage="{name}"}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+class Profile:
+    """ Profile of one request, captured with pyinstrument if requested and installed, else cProfile. """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.report = None
+
+    @contextmanager
+    def capture(self):
+        if self.kind == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                self.kind = 'cprofile'
+            else:
+                profiler = Profiler()
+                profiler.start()
+                try:
+                    yield self
+                finally:
+                    profiler.stop()
+                    self.report = profiler.output_text()
+                return
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield self
+        finally:
+            profiler.disable()
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(40)
+            self.report = output.getvalue()
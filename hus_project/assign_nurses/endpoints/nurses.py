@@ -1,13 +1,28 @@
 import pandas as pd
+from collections import defaultdict
+
+from .cache import FileCache
+from .metrics import stage
+from .snapshots import read_workbook
 
 from django.conf import settings
 excel_path = settings.EXCEL_PATH
 start_row = settings.START_ROW
 
+MONTH_SHEETS = {
+    1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril', 5: 'Mayo', 6: 'Junio',
+    7: 'Julio', 8: 'Agosto', 9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
+}
+VALID_SHIFTS = {'M', 'T', 'N', 'M;T', 'T;N', 'N;M'}
+SHIFT_ORDER = ['M', 'T', 'N', 'M;T', 'T;N', 'N;M']
+
+# Parsed month sheets of the roster workbook, rebuilt when the workbook changes
+roster_cache = FileCache()
+
 def load_excel_data(path, sheet, skip_rows):
     """ Load data from an Excel file and validate the presence of the 'NOMBRE Y APELLIDOS' column."""
     try:
-        df = pd.read_excel(path, sheet_name=sheet, skiprows=skip_rows)
+        df = read_workbook(path, sheet, skip_rows)
         df = df.dropna(axis=1, how='all')
         if "NOMBRE Y APELLIDOS" not in df.columns:
             raise ValueError("La columna 'NOMBRE Y APELLIDOS' no se encontró en la hoja")
@@ -18,21 +33,17 @@ def load_excel_data(path, sheet, skip_rows):
     except ValueError as e:
         raise ValueError(f"Error al leer la hoja {sheet}: {e}")
 
-def extract_day_columns(df, query_date):
-    """ Extract columns corresponding to the days of the specified month and year. """
-    month_year = query_date.strftime("%Y-%m")
-    columns = []
+def extract_date_columns(df):
+    """ Map every column whose header parses as a date to that date. """
+    columns = {}
     for col in df.columns:
         try:
             col_date = pd.to_datetime(str(col), errors='coerce')
             if pd.isna(col_date):
                 continue
-            if col_date.strftime("%Y-%m") == month_year:
-                columns.append(col)
+            columns[col] = col_date.date()
         except (ValueError, TypeError):
             continue
-    if not columns:
-        raise ValueError(f"No se encontraron columnas de fechas para el mes {month_year}")
     return columns
 
 def process_shifts(df, day_columns, valid_shifts):
@@ -46,71 +57,106 @@ def process_shifts(df, day_columns, valid_shifts):
         results.append(temp)
     return pd.concat(results, ignore_index=True) if results else pd.DataFrame(columns=['date', 'name', 'shift'])
 
-def group_shifts(df_results, shift_order):
-    """ Group shifts by date and shift type, summarizing nurse counts and names. """
-    if df_results.empty:
-        return pd.DataFrame(columns=['date', 'shift', 'nurse_count', 'nurses'])
-    summary = df_results.groupby(['date', 'shift']).agg(
-        nurse_count=('name', 'count'),
-        nurses=('name', lambda x: ', '.join(sorted(x)))
-    ).reset_index()
-    summary['shift'] = pd.Categorical(summary['shift'], categories=shift_order, ordered=True)
-    summary = summary.sort_values(['date', 'shift']).reset_index(drop=True)
-    return summary
-
-def display_shift_by_day_and_type(shift_summary, date, shift, shift_order):
-    """ Display nurses for a specific date and shift type, returning their IDs. """
-    if shift not in shift_order:
-        raise ValueError(f"Turno '{shift}' no es válido. Usa uno de: {', '.join(shift_order)}")
-
-    shift_map = {
-        'M': ['M'], 'T': ['T'], 'N': ['N'],
-        'M;T': ['M', 'T'], 'T;N': ['T', 'N'], 'N;M': ['N', 'M'],
-        'M;N': ['M', 'N'], 'T;M': ['T', 'M'], 'N;T': ['N', 'T']
-    }
-
-    shift_summary['date'] = pd.to_datetime(shift_summary['date']).dt.date
-    found_nurses = set()
-    for _, row in shift_summary[shift_summary['date'] == date].iterrows():
-        day_shifts = shift_map.get(row['shift'], [])
-        if shift in day_shifts:
-            nurses = row['nurses'].split(', ')
-            found_nurses.update(nurses)
-
-    if not found_nurses:
-        print(f"No hay datos para el {date} en el turno {shift}")
-        return []
-
-    nurse_ids = []
-    for name in found_nurses:
-        try:
-            nurse_id = str(name.split()[-1])
-            nurse_ids.append(nurse_id)
-        except (ValueError, IndexError):
-            print(f"Advertencia: No se pudo extraer ID de '{name}'. Ignorando.")
-    return sorted(nurse_ids)
-
-def get_nurse_shift(query_date, query_shift):
-    valid_shifts = {'M', 'T', 'N', 'M;T', 'T;N', 'N;M'}
-    shift_order = ['M', 'T', 'N', 'M;T', 'T;N', 'N;M']
-    pd.set_option('display.max_colwidth', None)
+# Base shifts worked by each roster code, composite codes like 'M;T' expanded
+SHIFT_PARTS = {
+    'M': ('M',), 'T': ('T',), 'N': ('N',),
+    'M;T': ('M', 'T'), 'T;N': ('T', 'N'), 'N;M': ('N', 'M'),
+    'M;N': ('M', 'N'), 'T;M': ('T', 'M'), 'N;T': ('N', 'T')
+}
+BASE_SHIFTS = ('M', 'T', 'N')
+
+def extract_nurse_ids(names):
+    """ ID of each nurse from the last word of their name, missing where it is not a number. """
+    ids = names.astype(str).str.split().str[-1]
+    # Only integer IDs reach the pipeline, which matches them with the history as integers
+    ids = ids.where(ids.str.fullmatch(r'\d+', na=False))
+    for name in names[ids.isna()]:
+        print(f"Advertencia: No se pudo extraer ID de '{name}'. Ignorando.")
+    return ids
+
+class RosterIndex:
+    """ Nurse IDs working each (date, base shift) of a roster month, composite shifts expanded.
+
+    Built once per workbook version from the (date, name, shift) rows of the sheet, so every
+    lookup is a dict access returning a frozenset.
+    """
+
+    def __init__(self, shift_results):
+        dates = pd.to_datetime(shift_results['date']).dt.date
+        nurse_ids = extract_nurse_ids(shift_results['name'])
+        found_nurses = defaultdict(set)
+        for date, day_shift, nurse_id in zip(dates, shift_results['shift'], nurse_ids):
+            if pd.isna(nurse_id):
+                continue
+            for shift in SHIFT_PARTS.get(day_shift, ()):
+                found_nurses[(date, shift)].add(nurse_id)
+        self.shifts = {key: frozenset(nurses) for key, nurses in found_nurses.items()}
+        self.dates = sorted({date for date, _ in self.shifts})
+
+    def nurses(self, date, shift):
+        """ Nurses working the base shift on date. """
+        return self.shifts.get((date, shift), frozenset())
+
+    def nurses_between(self, start, end, shift):
+        """ Nurses working the base shift on each rostered date from start to end, both included. """
+        return {date: self.nurses(date, shift) for date in self.dates if start <= date <= end}
+
+    def working_all(self, date, shifts):
+        """ Nurses working every one of the base shifts on date, e.g. ('T', 'N'). """
+        return frozenset.intersection(*[self.nurses(date, shift) for shift in shifts]) if shifts else frozenset()
+
+    def coverage(self, shifts=BASE_SHIFTS):
+        """ Number of nurses per date (rows) and shift (columns) of the month. """
+        return pd.DataFrame(
+            [[len(self.nurses(date, shift)) for shift in shifts] for date in self.dates],
+            index=pd.Index(self.dates, name='date'), columns=list(shifts)
+        )
+
+@stage('get_nurse_shift.load_roster')
+def load_month_roster(path, sheet, skip_rows, valid_shifts):
+    """ Parse a month sheet of the roster into its RosterIndex. """
+    df = load_excel_data(path, sheet, skip_rows)
+    date_columns = extract_date_columns(df)
+    shift_results = process_shifts(df, list(date_columns), valid_shifts)
+    months = {col_date.strftime("%Y-%m") for col_date in date_columns.values()}
+    return {'index': RosterIndex(shift_results), 'months': months}
+
+def get_month_roster(query_date, sheet, valid_shifts):
+    """ Return the parsed month sheet from the process-wide cache, reloading it if the workbook changed. """
+    try:
+        roster = roster_cache.get(
+            (str(excel_path), sheet, start_row), [excel_path],
+            lambda: load_month_roster(excel_path, sheet, start_row, valid_shifts)
+        )
+    except FileNotFoundError:
+        raise FileNotFoundError(f"El archivo {excel_path} no se encontró")
 
-    month_sheets = {
-        1: 'Enero', 2: 'Febrero', 3: 'Marzo', 4: 'Abril', 5: 'Mayo', 6: 'Junio',
-        7: 'Julio', 8: 'Agosto', 9: 'Septiembre', 10: 'Octubre', 11: 'Noviembre', 12: 'Diciembre'
-    }
+    month_year = query_date.strftime("%Y-%m")
+    if month_year not in roster['months']:
+        raise ValueError(f"No se encontraron columnas de fechas para el mes {month_year}")
+    return roster
 
+def get_roster(query_date):
+    """ Return the parsed roster of the month of query_date. """
     month = query_date.month
     try:
-        sheet_name = month_sheets[month]
+        sheet_name = MONTH_SHEETS[month]
     except KeyError:
         raise ValueError(f"No se encontró una hoja para el mes {month}")
 
-    df = load_excel_data(excel_path, sheet_name, start_row)
-    day_columns = extract_day_columns(df, query_date)
-    shift_results = process_shifts(df, day_columns, valid_shifts)
-    summary = group_shifts(shift_results, shift_order)
+    return get_month_roster(query_date, sheet_name, VALID_SHIFTS)
+
+def get_nurse_shift(query_date, query_shift, roster=None):
+    pd.set_option('display.max_colwidth', None)
+
+    if query_shift not in SHIFT_ORDER:
+        raise ValueError(f"Turno '{query_shift}' no es válido. Usa uno de: {', '.join(SHIFT_ORDER)}")
 
-    nurse_list = display_shift_by_day_and_type(summary, query_date.date(), query_shift, shift_order)
+    # Batch runs pass the roster of the month, parsed once for all of its shifts
+    if roster is None:
+        roster = get_roster(query_date)
+    nurse_list = sorted(roster['index'].nurses(query_date.date(), query_shift))
+    if not nurse_list:
+        print(f"No hay datos para el {query_date.date()} en el turno {query_shift}")
 
-    return query_date.date(), query_shift, nurse_list
\ No newline at end of file
+    return query_date.date(), query_shift, list(nurse_list)
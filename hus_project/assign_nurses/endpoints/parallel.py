@@ -0,0 +1,35 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+control_workers = settings.CONTROL_WORKERS
+
+pool = None
+pool_lock = threading.Lock()
+
+# Set in the worker processes of the pools, which must not preload inputs nor start watchers
+WORKER_ENV = 'ASSIGN_NURSES_WORKER'
+
+def setup_worker():
+    os.environ[WORKER_ENV] = '1'
+    django.setup()
+
+def get_pool():
+    global pool
+    with pool_lock:
+        if pool is None:
+            # Workers configure Django themselves, whatever the multiprocessing start method
+            pool = ProcessPoolExecutor(max_workers=control_workers, initializer=setup_worker)
+        return pool
+
+def map_controls(func, *iterables):
+    """ Apply func to the arguments of every control, in a process pool when CONTROL_WORKERS > 1.
+
+    Worth it for hospital-wide runs with many controls; for a single floor the work per
+    control is smaller than the cost of sending it to another process.
+    """
+    if control_workers <= 1:
+        return list(map(func, *iterables))
+    return list(get_pool().map(func, *iterables))
@@ -0,0 +1,65 @@
+import threading
+import time
+from datetime import datetime
+from importlib import import_module
+
+from . import historic, layout, nurses
+from .cache import file_digest, file_signature
+from .metrics import stage
+
+from django.conf import settings
+watch_interval = settings.PRELOAD_WATCH_INTERVAL
+
+watcher = None
+
+# Imported lazily by the pipeline; the preload imports them so the first request doesn't
+LAZY_MODULES = ['scipy.optimize', 'matplotlib.figure', 'matplotlib.patches', 'matplotlib.table']
+
+def watched_files():
+    return [nurses.excel_path, historic.file_hosp, historic.file_historic, historic.file_controls]
+
+def current_version():
+    """ Month of today and signature of every input file, None for missing files. """
+    signatures = []
+    for path in watched_files():
+        try:
+            signatures.append(file_signature(path))
+        except FileNotFoundError:
+            signatures.append(None)
+    return datetime.today().strftime("%Y-%m"), tuple(signatures)
+
+def preload():
+    """ Load and index today's month roster, the admissions, the history and controls.json into the process caches. """
+    steps = [
+        ('librerías', lambda: [import_module(module) for module in LAZY_MODULES]),
+        ('cuadrante', lambda: nurses.get_roster(datetime.today())),
+        ('ingresos e histórico', historic.load_inputs),
+        ('controls.json', lambda: layout.load_layout(historic.file_controls)),
+        ('huellas de los archivos', lambda: [file_digest(path) for path in watched_files()]),
+    ]
+    with stage('preload'):
+        for label, step in steps:
+            try:
+                step()
+            except Exception as e:
+                # A missing or broken file is reported by the requests; the other inputs still get warm
+                print(f"[WARN]: No se pudo precargar {label}: {e}")
+
+def watch():
+    """ Preload, then preload again whenever an input file changes or the month turns. """
+    version = None
+    while True:
+        current = current_version()
+        if current != version:
+            preload()
+            version = current
+        if watch_interval <= 0:
+            return
+        time.sleep(watch_interval)
+
+def start():
+    """ Start the preload and the file watcher in a background thread, once per process. """
+    global watcher
+    if watcher is None:
+        watcher = threading.Thread(target=watch, name='preload', daemon=True)
+        watcher.start()
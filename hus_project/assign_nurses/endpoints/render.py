@@ -0,0 +1,157 @@
+import contextvars
+import io
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+save_path = settings.SAVE_PATH
+save_url = settings.SAVE_URL
+artifacts_dir = settings.ARTIFACTS_DIR
+artifacts_max_count = settings.ARTIFACTS_MAX_COUNT
+artifacts_max_age = settings.ARTIFACTS_MAX_AGE
+artifacts_prune_interval = settings.ARTIFACTS_PRUNE_INTERVAL
+
+# Images are rendered off the request thread; the page polls the job status
+executor = ThreadPoolExecutor(max_workers=settings.RENDER_WORKERS, thread_name_prefix='render')
+
+# Formats of the images: matplotlib PNG, or the lightweight SVG and JSON of visuals.py
+RENDER_MODES = ('png', 'svg', 'json')
+
+MAX_TRACKED_JOBS = 256
+jobs = OrderedDict()
+jobs_lock = threading.Lock()
+
+# Time of the last scan of the artifact directories, which runs in the pool at most once per interval
+last_prune = [0.0]
+prune_lock = threading.Lock()
+
+class RenderJob:
+    """ Images of one assignation, rendered in the background pool into their own artifact directory.
+
+    The artifact id identifies the result (date, shift and inputs), so concurrent requests never
+    overwrite each other's images and the URL of an image never points to different content.
+    """
+
+    def __init__(self, artifact_id, mode='png'):
+        self.id = uuid.uuid4().hex
+        self.artifact_id = artifact_id
+        self.mode = mode
+        self.output_dir = os.path.join(save_path, artifacts_dir, artifact_id)
+        self.futures = []
+        # Tracked before pruning, so the directory of this job is never removed while it is in use
+        with jobs_lock:
+            jobs[self.id] = self
+            while len(jobs) > MAX_TRACKED_JOBS:
+                jobs.popitem(last=False)
+        schedule_prune()
+        os.makedirs(self.output_dir, exist_ok=True)
+        # A reused directory counts as new for the age and count limits
+        os.utime(self.output_dir)
+
+    def url(self, filename):
+        return f"{save_url}{artifacts_dir}/{self.artifact_id}/{filename}"
+
+    def image_urls(self):
+        """ URLs of the floor and table images, with the extension of the render mode. """
+        return {'rooms': self.url(f'rooms.{self.mode}'), 'table': self.url(f'table.{self.mode}')}
+
+    def submit(self, func, *args, **kwargs):
+        """ Render an image in the pool; func must save into output_dir in the given mode and return its (filename, content). """
+        # Run in a copy of the request context so stage records keep the request fields
+        context = contextvars.copy_context()
+        future = executor.submit(context.run, func, *args, output_dir=self.output_dir, mode=self.mode, **kwargs)
+        self.futures.append(future)
+        return future
+
+    def restore(self, images):
+        """ Write back previously rendered images that are no longer on disk, instead of rendering them again. """
+        for filename, content in images.items():
+            if not os.path.exists(os.path.join(self.output_dir, filename)):
+                write_image(filename, content, self.output_dir)
+
+    def when_done(self, callback):
+        """ Call callback with {filename: content} once every submitted image is saved successfully. """
+        futures = list(self.futures)
+        pending = [len(futures)]
+        lock = threading.Lock()
+
+        def on_done(_):
+            with lock:
+                pending[0] -= 1
+                if pending[0]:
+                    return
+            if all(future.exception() is None for future in futures):
+                callback(dict(future.result() for future in futures))
+
+        for future in futures:
+            future.add_done_callback(on_done)
+
+    def status(self):
+        if not all(future.done() for future in self.futures):
+            return 'pending'
+        if any(future.exception() is not None for future in self.futures):
+            return 'error'
+        return 'done'
+
+class SkipRender:
+    """ Render job that discards the figures, for runs that only need the assignation such as batch plans. """
+
+    def submit(self, func, *args, **kwargs):
+        return None
+
+def get_job_status(job_id):
+    """ Status of a render job: 'pending', 'done', 'error', or None if the job is unknown. """
+    with jobs_lock:
+        job = jobs.get(job_id)
+    return job.status() if job is not None else None
+
+def schedule_prune():
+    """ Prune the artifact directories in the pool, at most once every ARTIFACTS_PRUNE_INTERVAL seconds. """
+    with prune_lock:
+        now = time.monotonic()
+        if now - last_prune[0] < artifacts_prune_interval:
+            return
+        last_prune[0] = now
+    executor.submit(prune_artifacts)
+
+def prune_artifacts():
+    """ Remove artifact directories older than ARTIFACTS_MAX_AGE seconds, then the oldest beyond ARTIFACTS_MAX_COUNT.
+
+    Directories of the tracked render jobs are kept, whatever their age.
+    """
+    root = os.path.join(save_path, artifacts_dir)
+    with jobs_lock:
+        in_use = {job.artifact_id for job in jobs.values()}
+    try:
+        entries = sorted(os.scandir(root), key=lambda entry: entry.stat().st_mtime, reverse=True)
+    except FileNotFoundError:
+        return
+    now = time.time()
+    for position, entry in enumerate(entries):
+        if entry.name in in_use:
+            continue
+        if position >= artifacts_max_count or now - entry.stat().st_mtime > artifacts_max_age:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+def write_image(filename, content, output_dir=None):
+    """ Write an image atomically, so a page never loads a half-written file. """
+    output_dir = output_dir or save_path
+    output_path = os.path.join(output_dir, filename)
+    tmp_path = os.path.join(output_dir, f".{uuid.uuid4().hex}.{filename}")
+    with open(tmp_path, 'wb') as file:
+        file.write(content)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+def save_figure(fig, filename, output_dir=None, **kwargs):
+    """ Render a figure to memory and save it, returning its filename and content. """
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=os.path.splitext(filename)[1][1:], **kwargs)
+    content = buffer.getvalue()
+    write_image(filename, content, output_dir)
+    return filename, content
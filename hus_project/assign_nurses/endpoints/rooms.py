@@ -1,56 +1,100 @@
-import json
-import os
-from itertools import permutations
+from functools import lru_cache
+from math import factorial, prod
 
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
 
-from . import utils
+from . import utils, visuals
+from .layout import load_layout, orphan_counts, pair_positions, room_order
+from .metrics import stage
+from .parallel import map_controls
+from .render import save_figure
 
 from django.conf import settings
-save_path = settings.SAVE_PATH
 file_controls = settings.FILE_CONTROLS
+joint_assignation = settings.JOINT_ASSIGNATION
 
-def load_controls(control_list, control_path):
-    controls_path = os.path.join(control_path)
-
-    control_dict = {}
-    with open(controls_path, 'r') as file:
-        data = json.load(file)
-        for control in control_list:
-            if control in data:
-                control_dict[control] = {room["room"]: (room["x"], room["y"]) for room in data[control]}
-    return control_dict
+# Up to this many distinct group orders, ties are broken like the former permutation search
+LEGACY_TIE_ORDERS = 5000
 
-def create_room_groups(rooms, rooms_per_group):
-    rooms.sort(key=lambda room: room[0])
+def load_controls(control_list, control_path):
+    """ Coordinates of the rooms of every control of control_list, from the compiled layout. """
+    coords = load_layout(control_path).coords
+    return {control: coords[control] for control in control_list if control in coords}
+
+def distinct_orders(sizes, available):
+    """ Distinct orders of a multiset of group sizes, in the order itertools.permutations first yields them. """
+    if not any(available):
+        yield ()
+        return
+    for k, size in enumerate(sizes):
+        if available[k]:
+            for rest in distinct_orders(sizes, available[:k] + (available[k] - 1,) + available[k + 1:]):
+                yield (size,) + rest
+
+def create_room_groups(rooms, rooms_per_group, pairs=None):
+    """ Split the rooms, in bed order, into contiguous groups with the given sizes, in the order
+    that leaves the fewest orphaned 'B' beds.
+
+    rooms are (room, (x, y)) items; with the pairs of FloorLayout.pairs they must already be in
+    bed order, otherwise they are sorted and paired here.
+
+    The lowest orphan count is found by dynamic programming over the number of groups of each
+    size already placed, which determines where the next group starts, so the search is
+    polynomial in the number of groups instead of enumerating every permutation of the sizes.
+    When there are few distinct orders, ties are broken as set(permutations(rooms_per_group))
+    used to iterate them, so existing assignments do not change; otherwise the order closest
+    to rooms_per_group wins.
+    """
+    if pairs is None:
+        rooms = [rooms[position] for position in room_order(room for room, _ in rooms)]
+        pairs = pair_positions([room for room, _ in rooms])
+
+    sizes = list(dict.fromkeys(rooms_per_group))
+    available = tuple(rooms_per_group.count(size) for size in sizes)
+
+    # Orphans of every contiguous group of each size, computed at once over the pair table
+    orphans = {size: orphan_counts(pairs, size, sum(rooms_per_group)) for size in sizes}
+
+    def group_cost(start_index, end_index):
+        return int(orphans[end_index - start_index][start_index])
+
+    @lru_cache(maxsize=None)
+    def best_order(remaining):
+        """ Lowest orphan count and size order for the groups still to place. """
+        if not any(remaining):
+            return 0, ()
+        start_index = sum(size * (total - left) for size, total, left in zip(sizes, available, remaining))
+        best = None
+        for k, size in enumerate(sizes):
+            if remaining[k] == 0:
+                continue
+            rest_cost, rest_order = best_order(remaining[:k] + (remaining[k] - 1,) + remaining[k + 1:])
+            cost = group_cost(start_index, start_index + size) + rest_cost
+            if best is None or cost < best[0]:
+                best = (cost, (size,) + rest_order)
+        return best
+
+    def order_cost(order):
+        cost, start_index = 0, 0
+        for group_size in order:
+            cost += group_cost(start_index, start_index + group_size)
+            start_index += group_size
+        return cost
+
+    lowest_i, best_sizes = best_order(available)
+
+    n_orders = factorial(len(rooms_per_group)) // prod(factorial(count) for count in available)
+    contiguous = rooms_per_group == [size for size, count in zip(sizes, available) for _ in range(count)]
+    if contiguous and n_orders <= LEGACY_TIE_ORDERS:
+        # A set built from the distinct orders iterates exactly like the one built from all permutations
+        best_sizes = next(order for order in set(distinct_orders(sizes, available)) if order_cost(order) == lowest_i)
 
-    unique_perms = set(list(permutations(rooms_per_group)))
-    lowest_i = float('inf')
     best_grouped_rooms = []
-
-    for perm in unique_perms:
-        rooms_per_group = list(perm)
-        grouped_rooms = []
-        start_index = 0
-
-        for group_size in rooms_per_group:
-            end_index = start_index + group_size
-            grouped_rooms.append(rooms[start_index:end_index])
-            start_index = end_index
-
-        i = 0
-        for group in grouped_rooms:
-            for room in group:
-                room_id = room[0]
-                if room_id.endswith('B') and (room_id[:-1]) not in [r[0] for r in group]:
-                    i += 1
-        if i < lowest_i:
-            lowest_i = i
-            best_grouped_rooms = grouped_rooms
+    start_index = 0
+    for group_size in best_sizes:
+        end_index = start_index + group_size
+        best_grouped_rooms.append(rooms[start_index:end_index])
+        start_index = end_index
 
     final_groups = {}
     for i, group in enumerate(best_grouped_rooms):
@@ -58,14 +102,24 @@ def create_room_groups(rooms, rooms_per_group):
         final_groups[i] = group
     return best_grouped_rooms, final_groups
 
-def plot_room_distribution(floor_coord, groups_coords, n_groups, query_date, query_shift, w=1, h=1):
-    output_path = os.path.join(save_path, 'rooms.png')
-    cmap = plt.get_cmap('tab20', n_groups)
+@stage('render.rooms')
+def plot_room_distribution(floor_coord, groups_coords, n_groups, query_date, query_shift, w=1, h=1, output_dir=None, mode='png'):
+    if mode != 'png':
+        data = visuals.rooms_data(floor_coord, groups_coords, n_groups, query_date, query_shift, w, h)
+        return visuals.save_visual('rooms', data, visuals.rooms_svg, mode, output_dir)
+
+    # matplotlib is only imported when an image is rendered, not by batch runs and pool workers
+    import matplotlib
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Rectangle
+
+    # Figures are built without pyplot so they can be rendered from worker threads
+    # and are released as soon as they are saved
+    cmap = matplotlib.colormaps['tab20'].resampled(n_groups)
     group_colors = cmap.colors
 
-    plt.figure(figsize=(14, 8))
-    ax = plt.gca()
-    ax = plt.gca()
+    fig = Figure(figsize=(14, 8))
+    ax = fig.add_subplot()
     ax.set_xticks([])
     ax.set_yticks([])
     ax.tick_params(left=False, bottom=False, labelleft=False, labelbottom=False)
@@ -93,34 +147,47 @@ def plot_room_distribution(floor_coord, groups_coords, n_groups, query_date, que
             global_group_idx += 1
 
     query_shift = utils.parse_shift(query_shift)
-    plt.title(f'Distribución de pasillos para el turno {query_shift} del {query_date}')
-    plt.grid(True, color='black', linestyle='--', alpha=0.3)  
-    plt.axis('equal')
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    ax.set_title(f'Distribución de pasillos para el turno {query_shift} del {query_date}')
+    ax.grid(True, color='black', linestyle='--', alpha=0.3)  
+    ax.axis('equal')
+    return save_figure(fig, 'rooms.png', output_dir, dpi=300, bbox_inches='tight')
 
 
-def distribute_rooms(floor_occ_rooms, floor_patients, query_date, query_shift):
+def distribute_rooms(floor_occ_rooms, floor_patients, query_date, query_shift, render_job=None):
     control_names = list(floor_occ_rooms.keys())
-    floor_coord = load_controls(control_names, file_controls)
-    
-    floor_occu_rooms_coord = {}
+    layout = load_layout(file_controls)
+
+    occupied = {}
     for control, rooms in floor_occ_rooms.items():
         rooms_list = rooms if isinstance(rooms, (list, set)) else [rooms]
-        floor_occu_rooms_coord[control] = {
-            room: floor_coord[control][room] 
-            for room in rooms_list 
-            if room in floor_coord[control]
-        }
-
-    groups_lists = {}
-    groups_coord = {}
-    for control in control_names:
-        rooms_items = list(floor_occu_rooms_coord[control].items())
-        grouped_rooms, grouped_list = create_room_groups(rooms_items, floor_patients[control])
-        groups_lists[control] = grouped_list
-        groups_coord[control] = grouped_rooms
-    
-    n_groups = sum(len(v) for v in floor_patients.values())
-    plot_room_distribution(floor_coord, groups_coord, n_groups, query_date, query_shift)
+        occupied[control] = layout.occupied(control, rooms_list)
+
+    # Controls are independent, so their groups can be searched in parallel
+    with stage('distribute_rooms.create_room_groups'):
+        grouped = map_controls(
+            create_room_groups,
+            [layout.items(occupied[control]) for control in control_names],
+            [floor_patients[control] for control in control_names],
+            [layout.pairs(occupied[control]) for control in control_names],
+        )
+
+    groups_lists = {control: grouped_list for control, (_, grouped_list) in zip(control_names, grouped)}
+
+    # In joint mode assign_nurses moves the group boundaries, and draws the groups it keeps
+    if not joint_assignation:
+        render_groups(groups_lists, query_date, query_shift, render_job)
 
     return groups_lists
+
+def render_groups(groups_lists, query_date, query_shift, render_job=None):
+    """ Draw the room groups of every control on the floor plan, in the background when given a render job. """
+    floor_coord = load_controls(list(groups_lists), file_controls)
+    groups_coord = {
+        control: [[(room, floor_coord[control][room]) for room in group] for group in groups.values()]
+        for control, groups in groups_lists.items()
+    }
+    n_groups = sum(len(groups) for groups in groups_lists.values())
+    if render_job is not None:
+        render_job.submit(plot_room_distribution, floor_coord, groups_coord, n_groups, query_date, query_shift)
+    else:
+        plot_room_distribution(floor_coord, groups_coord, n_groups, query_date, query_shift)
@@ -0,0 +1,36 @@
+import pandas as pd
+
+# Internal column types of the admissions, history and summary frames. Nurse IDs stay strings
+# in the roster and in the responses, and are matched to the integer IDs of the frames.
+ID_DTYPE = 'int32'
+COUNT_DTYPE = 'int32'
+DATE_DTYPE = 'datetime64[ns]'
+
+RESUME_COLUMNS = ['ID_ENF', 'ID_PACIENTE', 'NUMERO_TRATAMIENTOS', 'FECHA_TOMA_MÁS_RECIENTE']
+# Admissions index: one row per admitted patient in a bed of controls.json, indexed by patient
+BED_INDEX_COLUMNS = ['ID_PACIENTE', 'CAMA', 'CAMA_NUMERO', 'CAMA_SUFIJO', 'CONTROL', 'POSICION']
+
+def split_bed(beds):
+    """ Split bed labels like '417B' into their integer number and their suffix. """
+    parts = beds.astype(str).str.extract(r'^(\d+)(\D*)$')
+    return pd.to_numeric(parts[0], errors='coerce').astype('Int32'), parts[1].fillna('')
+
+def bed_order(beds):
+    """ Integer sort key of bed labels: by number, and each bed before its suffixed partner ('417' < '417B'). """
+    number, suffix = split_bed(beds)
+    return number.astype('Int64') * 2 + (suffix != '').astype('Int64')
+
+def nurse_ids(nurses):
+    """ Integer IDs of the roster nurse IDs, in the same order. """
+    return [int(nurse) for nurse in nurses]
+
+def typed_resume(resume):
+    """ Cast a treatment summary to the internal types, sorted by nurse and patient. """
+    resume = resume.astype({
+        'ID_ENF': ID_DTYPE, 'ID_PACIENTE': ID_DTYPE,
+        'NUMERO_TRATAMIENTOS': COUNT_DTYPE, 'FECHA_TOMA_MÁS_RECIENTE': DATE_DTYPE,
+    })
+    return resume.sort_values(['ID_ENF', 'ID_PACIENTE']).reset_index(drop=True)
+
+def empty_resume():
+    return typed_resume(pd.DataFrame(columns=RESUME_COLUMNS))
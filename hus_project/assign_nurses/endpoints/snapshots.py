@@ -0,0 +1,117 @@
+import os
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # Snapshots are optional, Excel is always the fallback
+    pa = None
+    feather = None
+
+from .schema import ID_DTYPE, split_bed
+
+from django.conf import settings
+snapshot_path = settings.SNAPSHOT_PATH
+
+# Rows per record batch of a snapshot, and per chunk when a workbook is read in chunks
+CHUNK_ROWS = 65536
+
+def snapshots_available():
+    return feather is not None
+
+def get_snapshot_file(source, sheet=None, skip_rows=None):
+    """ Path of the Feather snapshot of a workbook, or of one of its sheets. """
+    name = Path(source).stem
+    if sheet is not None:
+        name += f".{sheet}"
+    if skip_rows:
+        name += f".skip{skip_rows}"
+    return Path(snapshot_path) / f"{name}.feather"
+
+def is_fresh(snapshot_file, source):
+    """ A snapshot is only used when it was written after the last change of its source workbook. """
+    try:
+        return os.stat(snapshot_file).st_mtime_ns >= os.stat(source).st_mtime_ns
+    except FileNotFoundError:
+        return False
+
+def normalize_admissions(df):
+    df = df.dropna(subset=['ID_PACIENTE']).copy()
+    df['ID_PACIENTE'] = df['ID_PACIENTE'].astype(ID_DTYPE)
+    df['CAMA'] = df['CAMA'].astype(str)
+    df['CAMA_NUMERO'], df['CAMA_SUFIJO'] = split_bed(df['CAMA'])
+    return df
+
+def normalize_historic(df):
+    df = df.dropna(subset=['ID_PACIENTE']).copy()
+    df['ID_ENF'] = df['ID_ENF'].fillna(0).astype(ID_DTYPE)
+    df['ID_PACIENTE'] = df['ID_PACIENTE'].astype(ID_DTYPE)
+    df['FECHA_TOMA'] = pd.to_datetime(df['FECHA_TOMA'], errors='coerce')
+    return df
+
+def normalize_sheet(df):
+    """ Make a raw sheet storable in Arrow: string headers and mixed object columns as text. """
+    df = df.copy()
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].map(lambda value: None if pd.isna(value) else str(value))
+    return df
+
+def write_snapshot(df, snapshot_file):
+    Path(snapshot_file).parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = Path(f"{snapshot_file}.tmp")
+    feather.write_feather(df.reset_index(drop=True), tmp_file, compression='uncompressed', chunksize=CHUNK_ROWS)
+    os.replace(tmp_file, snapshot_file)
+
+def read_snapshot(snapshot_file):
+    # Uncompressed Feather files are memory-mapped instead of copied
+    return feather.read_table(snapshot_file, memory_map=True).to_pandas()
+
+def read_workbook(source, sheet=None, skip_rows=None):
+    """ Read a workbook sheet from its snapshot when it is up to date, falling back to the Excel file. """
+    if snapshots_available():
+        snapshot_file = get_snapshot_file(source, sheet, skip_rows)
+        if is_fresh(snapshot_file, source):
+            return read_snapshot(snapshot_file)
+    return pd.read_excel(source, sheet_name=sheet or 0, skiprows=skip_rows)
+
+
+def iter_workbook_chunks(source, columns, chunk_rows=CHUNK_ROWS):
+    """ Read columns of the first sheet of a workbook as DataFrames of at most chunk_rows rows.
+
+    Only one chunk is materialized at a time: record batches of the memory-mapped snapshot when it
+    is up to date, otherwise rows of the Excel file read by openpyxl in read-only mode.
+    """
+    if snapshots_available():
+        snapshot_file = get_snapshot_file(source)
+        if is_fresh(snapshot_file, source):
+            with pa.memory_map(str(snapshot_file)) as mapped:
+                reader = pa.ipc.open_file(mapped)
+                for index in range(reader.num_record_batches):
+                    yield reader.get_batch(index).select(columns).to_pandas()
+            return
+
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+        missing = [column for column in columns if column not in header]
+        if missing:
+            raise KeyError(f"Columnas no encontradas en {Path(source).name}: {', '.join(missing)}")
+        positions = [header.index(column) for column in columns]
+
+        chunk = []
+        for row in rows:
+            chunk.append([row[position] if position < len(row) else None for position in positions])
+            if len(chunk) == chunk_rows:
+                yield pd.DataFrame(chunk, columns=columns)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns)
+    finally:
+        workbook.close()
@@ -32,4 +32,10 @@ def parse_shift(shift_str):
     elif shift_str in inverse_map:
         return inverse_map[shift_str]
     else:
-        raise ValueError("Invalid shift. Expected 'M', 'T', 'N' or 'Mañana', 'Tarde', 'Noche'.")
\ No newline at end of file
+        raise ValueError("Invalid shift. Expected 'M', 'T', 'N' or 'Mañana', 'Tarde', 'Noche'.")
+
+def shift_code(shift_str):
+    """ Parse a shift given by its shorthand or full name into its shorthand. """
+    if shift_str in ('M', 'T', 'N'):
+        return shift_str
+    return parse_shift(shift_str)
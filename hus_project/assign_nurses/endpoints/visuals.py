@@ -0,0 +1,123 @@
+import json
+from html import escape
+
+import numpy as np
+
+from . import utils
+from .render import write_image
+
+# Lightweight alternatives to the matplotlib PNGs: the same floor and table as JSON for the page
+# to draw, or as SVG built as text. Neither needs matplotlib.
+
+# matplotlib's tab20, so groups keep the colors of the PNG mode
+TAB20 = [
+    '#1f77b4', '#aec7e8', '#ff7f0e', '#ffbb78', '#2ca02c', '#98df8a', '#d62728', '#ff9896', '#9467bd', '#c5b0d5',
+    '#8c564b', '#c49c94', '#e377c2', '#f7b6d2', '#7f7f7f', '#c7c7c7', '#bcbd22', '#dbdb8d', '#17becf', '#9edae5',
+]
+SCALE = 40  # SVG pixels per floor unit
+ROW_HEIGHT = 32
+COLUMN_WIDTH = 170
+
+def group_colors(n_groups):
+    """ Colors of colormaps['tab20'].resampled(n_groups), as hex strings. """
+    positions = np.linspace(0, 1, n_groups) * len(TAB20)
+    positions[positions == len(TAB20)] = len(TAB20) - 1
+    return [TAB20[position] for position in positions.astype(int)]
+
+def rooms_data(floor_coord, groups_coords, n_groups, query_date, query_shift, w=1, h=1):
+    """ Rooms of the floor and rooms, color and label position of every group, as in plot_room_distribution. """
+    colors = group_colors(n_groups)
+    rooms, groups = [], []
+    for control, control_groups in groups_coords.items():
+        rooms.extend({'room': room, 'x': x, 'y': y} for room, (x, y) in floor_coord[control].items())
+        for group in control_groups:
+            index = len(groups)
+            groups.append({
+                'name': f"Grupo {index + 1}",
+                'color': colors[index % len(colors)],
+                'rooms': [{'room': room, 'x': x, 'y': y} for room, (x, y) in group],
+                'center': [float(np.mean([x + w/2 for _, (x, _) in group])), float(np.mean([y + h/2 for _, (_, y) in group]))],
+            })
+    title = f'Distribución de pasillos para el turno {utils.parse_shift(query_shift)} del {query_date}'
+    return {'title': title, 'w': w, 'h': h, 'rooms': rooms, 'groups': groups}
+
+def table_data(mapping, query_date, query_shift):
+    """ Rows of the assignation table, as in create_table. """
+    return {
+        'title': f'Tabla de asignación de enfermeras para el turno {utils.parse_shift(query_shift)} del {query_date}',
+        'headers': ['Grupo', 'ID Enfermera', 'Habitaciones', 'Nº Pacientes'],
+        'rows': [[key, *values] for key, values in mapping.items()],
+    }
+
+def svg_document(width, height, title, body):
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" width="{width}" height="{height}" '
+        f'font-family="sans-serif"><text x="{width / 2}" y="24" text-anchor="middle" font-size="16">{escape(title)}</text>'
+        f'{"".join(body)}</svg>'
+    )
+
+def rooms_svg(data):
+    """ SVG of rooms_data, with the y axis pointing up like the PNG. """
+    w, h = data['w'], data['h']
+    cells = data['rooms'] + [room for group in data['groups'] for room in group['rooms']]
+    if not cells:
+        return svg_document(400, 40, data['title'], [])
+    min_x = min(cell['x'] for cell in cells)
+    max_x = max(cell['x'] for cell in cells) + w
+    min_y = min(cell['y'] for cell in cells)
+    max_y = max(cell['y'] for cell in cells) + h
+    top = 40
+
+    def px(x):
+        return round((x - min_x) * SCALE + 10, 1)
+
+    def py(y):
+        return round((max_y - y) * SCALE + top, 1)
+
+    body = [
+        f'<rect x="{px(cell["x"])}" y="{py(cell["y"] + h)}" width="{w * SCALE}" height="{h * SCALE}" '
+        f'fill="lightgray" fill-opacity="0.5" stroke="black"/>'
+        for cell in data['rooms']
+    ]
+    for group in data['groups']:
+        for cell in group['rooms']:
+            body.append(
+                f'<rect x="{px(cell["x"])}" y="{py(cell["y"] + h)}" width="{w * SCALE}" height="{h * SCALE}" '
+                f'fill="{group["color"]}" stroke="black"/>'
+                f'<text x="{px(cell["x"] + w / 2)}" y="{py(cell["y"] + h / 2)}" text-anchor="middle" '
+                f'dominant-baseline="middle" font-size="10">{escape(cell["room"])}</text>'
+            )
+        center_x, center_y = px(group['center'][0]), py(group['center'][1])
+        body.append(
+            f'<rect x="{center_x - 40}" y="{center_y - 17}" width="80" height="34" fill="black" fill-opacity="0.5"/>'
+            f'<text x="{center_x}" y="{center_y - 3}" text-anchor="middle" font-size="11" fill="white">{escape(group["name"])}</text>'
+            f'<text x="{center_x}" y="{center_y + 11}" text-anchor="middle" font-size="11" fill="white">{len(group["rooms"])} camas</text>'
+        )
+    return svg_document(px(max_x) + 10, py(min_y) + 10, data['title'], body)
+
+def table_svg(data):
+    """ SVG of table_data. """
+    top = 40
+    body = []
+    for row_index, row in enumerate([data['headers']] + data['rows']):
+        y = top + row_index * ROW_HEIGHT
+        fill = 'lightgrey' if row_index == 0 else 'white'
+        for column_index, value in enumerate(row):
+            x = 10 + column_index * COLUMN_WIDTH
+            body.append(
+                f'<rect x="{x}" y="{y}" width="{COLUMN_WIDTH}" height="{ROW_HEIGHT}" fill="{fill}" stroke="black"/>'
+                f'<text x="{x + COLUMN_WIDTH / 2}" y="{y + ROW_HEIGHT / 2}" text-anchor="middle" '
+                f'dominant-baseline="middle" font-size="13">{escape(str(value))}</text>'
+            )
+    width = 20 + len(data['headers']) * COLUMN_WIDTH
+    height = top + (len(data['rows']) + 1) * ROW_HEIGHT + 10
+    return svg_document(width, height, data['title'], body)
+
+def save_visual(name, data, to_svg, mode, output_dir=None):
+    """ Save data as name.json or, through to_svg, as name.svg, returning its filename and content. """
+    if mode == 'json':
+        filename, content = f'{name}.json', json.dumps(data, ensure_ascii=False).encode()
+    else:
+        filename, content = f'{name}.svg', to_svg(data).encode()
+    write_image(filename, content, output_dir)
+    return filename, content
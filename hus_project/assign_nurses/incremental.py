@@ -0,0 +1,276 @@
+import copy
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from .endpoints import assign, historic
+from .endpoints.assign import create_branch_schema, extract_and_assign_groups, format_mapping, merge_historial_resume, pair_matrices
+from .endpoints.cache import file_digest
+from .endpoints.layout import load_layout
+from .endpoints.nurses import get_nurse_shift, get_roster
+from .endpoints.render import RenderJob, SkipRender
+from .endpoints.rooms import create_room_groups, distribute_rooms, render_groups
+from .endpoints.metrics import request_context, stage
+from .run_assignation import artifact_id, input_files, result_key
+
+# Last assignation of every (date, shift) updated in this process, with what its updates need:
+# admissions, room groups, beds of each nurse and the (nurse, bed) cost arrays
+MAX_STATES = 64
+states = OrderedDict()
+states_lock = threading.Lock()
+# Lock of every (date, shift) being updated, with the number of updates holding or waiting for it
+shift_locks = {}
+
+@contextmanager
+def shift_lock(key):
+    """ Hold the lock of a (date, shift) while its state is built or updated; other shifts are not blocked.
+    The lock is dropped once no update uses it, so the map only holds the shifts being updated.
+    """
+    with states_lock:
+        entry = shift_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with states_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del shift_locks[key]
+
+def parse_delta(body):
+    """ Delta of an update request: admitted patients and bed moves as {patient, bed}, discharged patient IDs
+    and absent nurse IDs.
+    """
+    return {
+        'admit': [(int(item['patient']), str(item['bed'])) for item in body.get('admit', [])],
+        'discharge': [int(patient) for patient in body.get('discharge', [])],
+        'move': [(int(item['patient']), str(item['bed'])) for item in body.get('move', [])],
+        'absent': [str(nurse) for nurse in body.get('absent', [])],
+    }
+
+def build_state(query_date, query_shift):
+    """ Assignation of a shift from the input files, as run_assignation.main computes it, kept for updates. """
+    str_date = query_date.strftime("%Y-%m-%d")
+    inputs = historic.load_inputs()
+    date, shift, nurses = get_nurse_shift(query_date, query_shift, get_roster(query_date))
+    if not nurses:
+        raise ValueError('No hay enfermeras en el turno')
+
+    occupied_rooms, rooms_per_control, summary = historic.get_historic(date, shift, nurses, inputs)
+    groups = distribute_rooms(occupied_rooms, rooms_per_control, str_date, query_shift, SkipRender())
+    merged = merge_historial_resume(summary)
+    if assign.joint_assignation:
+        groups = assign.joint_groups(groups, nurses, merged, query_date, query_shift)
+    all_groups = extract_and_assign_groups(groups)
+    mapping = create_branch_schema(nurses, all_groups, merged, query_date)
+
+    # The admissions are shared by the process caches, the state gets its own copy
+    controls = {control: dict(control_dict) for control, control_dict in inputs['controls'].items()}
+    room_index = {bed: i for i, bed in enumerate(bed for control_dict in controls.values() for bed in control_dict.values())}
+    pair_cost, pair_treatments = pair_matrices(nurses, room_index, merged, query_date)
+    return {
+        'date': date,
+        'shift': shift,
+        'nurses': list(nurses),
+        'controls': controls,
+        'rooms_per_control': rooms_per_control,
+        'groups': groups,
+        'beds': {nurse: set(all_groups[group]) for group, (nurse, _, _) in mapping.items()},
+        'room_index': room_index,
+        'pair_cost': pair_cost,
+        'pair_treatments': pair_treatments,
+        'columns': {},
+        'version': 0,
+    }
+
+def bed_columns(state, beds):
+    """ Column of every bed in the pair arrays, adding columns without history for new beds. """
+    room_index = state['room_index']
+    new_beds = [bed for bed in dict.fromkeys(beds) if bed not in room_index]
+    if new_beds:
+        for bed in new_beds:
+            room_index[bed] = len(room_index)
+        n_nurses = len(state['nurses'])
+        state['pair_cost'] = np.hstack([state['pair_cost'], np.full((n_nurses, len(new_beds)), 4.0)])
+        state['pair_treatments'] = np.hstack([state['pair_treatments'], np.zeros((n_nurses, len(new_beds)))])
+    return [room_index[bed] for bed in beds]
+
+def admit_history(state, query_date, admitted):
+    """ Fill the columns of the admitted patients' beds from their own history only. """
+    controls = {}
+    for control, patient, bed in admitted:
+        controls.setdefault(control, {})[patient] = bed
+    summary = historic.treatment_historial(historic.file_historic, controls, state['nurses'], state['date'])
+    beds = [bed for _, _, bed in admitted]
+    pair_cost, pair_treatments = pair_matrices(state['nurses'], {bed: k for k, bed in enumerate(beds)}, merge_historial_resume(summary), query_date)
+    columns = bed_columns(state, beds)
+    state['pair_cost'][:, columns] = pair_cost
+    state['pair_treatments'][:, columns] = pair_treatments
+
+def apply_delta(state, query_date, admit=(), discharge=(), move=(), absent=()):
+    """ Update the admissions and nurses of state, regroup only the controls that changed and repair the assignment.
+
+    The new assignment keeps as many beds as possible with the nurse that had them and, among those,
+    has the lowest cost. Returns the formatted mapping and what changed.
+    """
+    layout = load_layout(historic.file_controls)
+    controls = state['controls']
+    located = {patient: control for control, control_dict in controls.items() for patient in control_dict}
+    occupied = {bed for control_dict in controls.values() for bed in control_dict.values()}
+    touched = set()
+
+    def leave(patient):
+        if patient not in located:
+            raise ValueError(f"El paciente {patient} no está ingresado")
+        control = located.pop(patient)
+        bed = controls[control].pop(patient)
+        occupied.discard(bed)
+        touched.add(control)
+        return bed
+
+    def place(patient, bed):
+        if bed not in layout.bed_controls:
+            raise ValueError(f"La cama {bed} no existe en controls.json")
+        if bed in occupied:
+            raise ValueError(f"La cama {bed} está ocupada")
+        control = layout.bed_controls[bed]
+        controls[control][patient] = bed
+        located[patient] = control
+        occupied.add(bed)
+        touched.add(control)
+        return control
+
+    for patient in discharge:
+        leave(patient)
+    for patient, bed in move:
+        # The history of a patient follows them to the new bed
+        old_column, new_column = bed_columns(state, [leave(patient), bed])
+        place(patient, bed)
+        state['pair_cost'][:, new_column] = state['pair_cost'][:, old_column]
+        state['pair_treatments'][:, new_column] = state['pair_treatments'][:, old_column]
+    admitted = []
+    for patient, bed in admit:
+        if patient in located:
+            raise ValueError(f"El paciente {patient} ya está ingresado")
+        admitted.append((place(patient, bed), patient, bed))
+
+    for nurse in absent:
+        if nurse not in state['nurses']:
+            raise ValueError(f"La enfermera {nurse} no trabaja en el turno")
+    if absent:
+        keep = [i for i, nurse in enumerate(state['nurses']) if nurse not in absent]
+        state['nurses'] = [state['nurses'][i] for i in keep]
+        state['pair_cost'] = state['pair_cost'][keep]
+        state['pair_treatments'] = state['pair_treatments'][keep]
+        state['columns'] = {group: (cost[keep], treatments[keep]) for group, (cost, treatments) in state['columns'].items()}
+        for nurse in absent:
+            state['beds'].pop(nurse, None)
+    if not state['nurses']:
+        raise ValueError('No hay enfermeras en el turno')
+    if admitted:
+        with stage('incremental.admit_history'):
+            admit_history(state, query_date, admitted)
+
+    for control in touched:
+        # Keep the admissions of every control in bed order, as extract_patient_bed leaves them
+        controls[control] = dict(sorted(controls[control].items(), key=lambda item: layout.index[item[1]]))
+    # A bed of a touched control may hold another patient now, so its group costs are computed again
+    state['columns'] = {group_id: columns for group_id, columns in state['columns'].items() if group_id[0] not in touched}
+
+    # Only controls whose patients or number of nurses changed are grouped again
+    nurses_per_control = historic.calculate_nurses_per_control(len(state['nurses']), controls)
+    rooms_per_control = historic.number_rooms_per_nurses_per_control(controls, nurses_per_control, state['shift'])
+    regrouped = [
+        control for control in controls
+        if control in touched or rooms_per_control[control] != state['rooms_per_control'].get(control)
+    ]
+    for control in regrouped:
+        positions = layout.occupied(control, controls[control].values())
+        _, state['groups'][control] = create_room_groups(layout.items(positions), rooms_per_control[control], layout.pairs(positions))
+    state['rooms_per_control'] = rooms_per_control
+
+    mapping, changed_nurses = repair_assignment(state, query_date)
+    state['version'] += 1
+    return mapping, {'controls': regrouped, 'nurses': changed_nurses}
+
+def repair_assignment(state, query_date):
+    """ Assign the nurses to the current groups, reusing the cost columns of the groups that did not change. """
+    from scipy.optimize import linear_sum_assignment
+
+    all_groups = extract_and_assign_groups(state['groups'])
+    group_ids = [
+        (control, tuple(group)) for control, groups in state['groups'].items() for group in groups.values()
+    ]
+    columns = {}
+    for group_id in group_ids:
+        if group_id not in state['columns']:
+            beds = bed_columns(state, group_id[1])
+            state['columns'][group_id] = (state['pair_cost'][:, beds].sum(axis=1), state['pair_treatments'][:, beds].sum(axis=1))
+        columns[group_id] = state['columns'][group_id]
+    # Columns of groups that no longer exist are dropped
+    state['columns'] = columns
+
+    nurses = state['nurses']
+    cost_matrix = np.column_stack([columns[group_id][0] for group_id in group_ids])
+    treatments_matrix = np.column_stack([columns[group_id][1] for group_id in group_ids])
+    kept = np.array([
+        [len(state['beds'].get(nurse, set()).intersection(beds)) for _, beds in group_ids] for nurse in nurses
+    ])
+
+    # Kept beds first, cost second: no cost difference outweighs one bed that changes nurse
+    weight = cost_matrix.max(initial=0) * len(nurses) + 1
+    with stage('incremental.hungarian'):
+        row_ind, col_ind = linear_sum_assignment(cost_matrix - weight * kept)
+
+    group_keys = list(all_groups.keys())
+    mapping, beds = {}, {}
+    for i, j in zip(row_ind, col_ind):
+        mapping[group_keys[j]] = (nurses[i], int(cost_matrix[i][j]), int(treatments_matrix[i][j]))
+        beds[nurses[i]] = set(all_groups[group_keys[j]])
+    changed_nurses = [nurse for nurse in nurses if beds.get(nurse) != state['beds'].get(nurse)]
+    state['beds'] = beds
+    return format_mapping(mapping, all_groups), changed_nurses
+
+def update_assignation(query_date, query_shift, delta, render_mode=None):
+    """ Apply delta to the last assignation of (date, shift) in this process, computed from the input files
+    when there is none yet or the files changed since.
+
+    The work is proportional to the controls the delta touches. Each process keeps its own
+    states, so updates to a shift should go to the same process. Images are rendered in the
+    background when render_mode is given.
+    """
+    str_date = query_date.strftime("%Y-%m-%d")
+    key = result_key(query_date, query_shift)
+    digests = tuple(file_digest(path) for path in input_files())
+    state_key = (str_date, query_shift)
+    # Updates of a shift run one after another; other shifts are not blocked meanwhile
+    with request_context(date=str_date, shift=query_shift), stage('incremental.update'), shift_lock(state_key):
+        with states_lock:
+            state = states.get(state_key)
+        if state is None or state['digests'] != digests:
+            with stage('incremental.build_state'):
+                state = build_state(query_date, query_shift)
+            state['digests'] = digests
+            with states_lock:
+                states[state_key] = state
+        # Applied to a copy, so a delta rejected halfway leaves the stored state as it was
+        state = copy.deepcopy(state)
+        mapping, changes = apply_delta(state, query_date, **delta)
+        with states_lock:
+            states[state_key] = state
+            states.move_to_end(state_key)
+            while len(states) > MAX_STATES:
+                states.popitem(last=False)
+        groups = {control: dict(groups) for control, groups in state['groups'].items()}
+        version = state['version']
+
+    response = {'data': mapping, 'changes': changes, 'version': version}
+    if render_mode is not None:
+        render_job = RenderJob(f"{artifact_id(key)}_v{version}", render_mode)
+        render_groups(groups, str_date, query_shift, render_job)
+        render_job.submit(assign.create_table, dict(mapping), str_date, query_shift)
+        response.update({'job': render_job.id, 'images': render_job.image_urls()})
+    return response
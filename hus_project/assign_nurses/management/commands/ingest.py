@@ -0,0 +1,53 @@
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from assign_nurses.endpoints import history_store, snapshots
+from assign_nurses.endpoints.nurses import MONTH_SHEETS
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert the hospital Excel workbooks into typed Feather snapshots read by the endpoints, "
+        "and fold new treatment history rows into the history store."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rewrite snapshots that are already up to date.")
+
+    def handle(self, *args, **options):
+        if not snapshots.snapshots_available():
+            raise CommandError("pyarrow no está instalado, no se pueden generar las instantáneas")
+
+        self.ingest(settings.FILE_HOSP, snapshots.normalize_admissions, options['force'])
+        self.ingest(settings.FILE_HISTORIC, snapshots.normalize_historic, options['force'])
+        for sheet in MONTH_SHEETS.values():
+            self.ingest(settings.EXCEL_PATH, snapshots.normalize_sheet, options['force'], sheet, settings.START_ROW)
+
+        if settings.HISTORY_STORE and settings.FILE_HISTORIC.exists():
+            try:
+                new_rows = history_store.sync_history(settings.FILE_HISTORIC)
+            except DatabaseError as e:
+                raise CommandError(f"No se pudo actualizar el almacén del histórico: {e}")
+            self.stdout.write(self.style.SUCCESS(f"{settings.FILE_HISTORIC.name}: {new_rows} filas nuevas en el almacén"))
+
+    def ingest(self, source, normalize, force, sheet=None, skip_rows=None):
+        label = f"{source.name} [{sheet}]" if sheet else source.name
+        if not source.exists():
+            self.stderr.write(self.style.WARNING(f"{label}: el archivo no existe, se omite"))
+            return
+
+        snapshot_file = snapshots.get_snapshot_file(source, sheet, skip_rows)
+        if not force and snapshots.is_fresh(snapshot_file, source):
+            self.stdout.write(f"{label}: instantánea al día")
+            return
+
+        try:
+            df = pd.read_excel(source, sheet_name=sheet or 0, skiprows=skip_rows)
+        except ValueError as e:
+            self.stderr.write(self.style.WARNING(f"{label}: {e}"))
+            return
+
+        snapshots.write_snapshot(normalize(df), snapshot_file)
+        self.stdout.write(self.style.SUCCESS(f"{label}: {len(df)} filas -> {snapshot_file.name}"))
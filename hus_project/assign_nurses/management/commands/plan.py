@@ -0,0 +1,56 @@
+import sys
+from contextlib import redirect_stdout
+
+from django.core.management.base import BaseCommand, CommandError
+
+from assign_nurses import batch, continuity
+from assign_nurses.endpoints import utils
+
+
+class Command(BaseCommand):
+    help = (
+        "Assign the nurses of every shift in a date range, loading the roster, admissions and history once. "
+        "Writes one JSON line per shift, or an Excel workbook when --output ends in .xlsx."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', required=True, help="First date, YYYY-MM-DD.")
+        parser.add_argument('--end', required=True, help="Last date, YYYY-MM-DD, included.")
+        parser.add_argument('--shifts', nargs='+', default=batch.SHIFTS, help="Shifts to plan: M T N or Mañana Tarde Noche.")
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes, BATCH_WORKERS by default.")
+        parser.add_argument('--output', help="Output file (.ndjson or .xlsx); standard output by default.")
+        parser.add_argument(
+            '--continuity', action='store_true',
+            help="Solve the shifts in order so nurses working back-to-back shifts keep their rooms (single process)."
+        )
+        parser.add_argument('--weight', type=float, default=None, help="Continuity weight, CONTINUITY_WEIGHT by default.")
+
+    def handle(self, *args, **options):
+        try:
+            start = utils.parse_date(options['start'])
+            end = utils.parse_date(options['end'])
+            shifts = [utils.shift_code(shift) for shift in options['shifts']]
+        except ValueError as e:
+            raise CommandError(e)
+        if end < start:
+            raise CommandError("La fecha final es anterior a la inicial")
+
+        if options['continuity']:
+            results = continuity.plan_continuity(start, end, shifts, options['weight'])
+        else:
+            results = batch.plan_batch(start, end, shifts, options['workers'])
+        output = options['output']
+        if output and output.endswith('.xlsx'):
+            batch.write_workbook(results, output)
+        elif output:
+            with open(output, 'w', encoding='utf-8') as file:
+                file.writelines(batch.to_ndjson(results))
+        else:
+            # Progress messages of the pipeline go to stderr, keeping stdout valid NDJSON
+            with redirect_stdout(sys.stderr):
+                for line in batch.to_ndjson(results):
+                    self.stdout.write(line, ending='')
+                    self.stdout.flush()
+            return
+
+        self.stderr.write(self.style.SUCCESS(f"Plan guardado en {output}"))
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from assign_nurses.endpoints.nurses import BASE_SHIFTS, get_roster
+
+
+class Command(BaseCommand):
+    help = "Print the number of nurses rostered on each date and shift of a month."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', required=True, help="Month to report, YYYY-MM.")
+        parser.add_argument(
+            '--both', nargs='+', metavar='SHIFT',
+            help="Also count the nurses working all of these shifts on the same date, e.g. --both T N."
+        )
+        parser.add_argument('--output', help="Write the report as CSV instead of printing it.")
+
+    def handle(self, *args, **options):
+        try:
+            month = datetime.strptime(options['month'], "%Y-%m")
+            index = get_roster(month)['index']
+        except (ValueError, FileNotFoundError) as e:
+            raise CommandError(e)
+
+        report = index.coverage()
+        report = report[[date.strftime("%Y-%m") == options['month'] for date in report.index]]
+        if options['both']:
+            shifts = options['both']
+            invalid = [shift for shift in shifts if shift not in BASE_SHIFTS]
+            if invalid:
+                raise CommandError(f"Turnos no válidos: {', '.join(invalid)}. Usa {', '.join(BASE_SHIFTS)}")
+            report['+'.join(shifts)] = [len(index.working_all(date, shifts)) for date in report.index]
+
+        if options['output']:
+            report.to_csv(options['output'])
+            self.stdout.write(self.style.SUCCESS(f"Cobertura guardada en {options['output']}"))
+        else:
+            self.stdout.write(report.to_string())
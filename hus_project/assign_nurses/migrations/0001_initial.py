@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryIngestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True)),
+                ('rows', models.IntegerField(default=0)),
+                ('mtime_ns', models.BigIntegerField(default=0)),
+                ('size', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TreatmentDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nurse_id', models.IntegerField()),
+                ('patient_id', models.BigIntegerField()),
+                ('fecha_toma', models.DateField()),
+                ('treatments', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['nurse_id', 'fecha_toma'], name='assign_nurs_nurse_i_48df14_idx'), models.Index(fields=['patient_id', 'fecha_toma'], name='assign_nurs_patient_aa5723_idx')],
+                'constraints': [models.UniqueConstraint(fields=('nurse_id', 'patient_id', 'fecha_toma'), name='unique_treatment_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import models
+
+
+class TreatmentDay(models.Model):
+    """ Number of treatments a nurse gave a patient on one day, aggregated from hcoIngresos.xlsx. """
+    nurse_id = models.IntegerField()
+    patient_id = models.BigIntegerField()
+    fecha_toma = models.DateField()
+    treatments = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['nurse_id', 'patient_id', 'fecha_toma'], name='unique_treatment_day'),
+        ]
+        indexes = [
+            models.Index(fields=['nurse_id', 'fecha_toma']),
+            models.Index(fields=['patient_id', 'fecha_toma']),
+        ]
+
+
+class HistoryIngestion(models.Model):
+    """ Watermark of the rows of a history file already folded into TreatmentDay. """
+    source = models.CharField(max_length=255, unique=True)
+    rows = models.IntegerField(default=0)
+    mtime_ns = models.BigIntegerField(default=0)
+    size = models.BigIntegerField(default=0)
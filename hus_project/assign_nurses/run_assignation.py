@@ -1,41 +1,153 @@
-import time
-from .endpoints.nurses import get_nurse_shift
-from .endpoints.historic import get_historic
+import asyncio
+import copy
+import hashlib
+from collections import namedtuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .endpoints.cache import ResultCache, file_digest
+from .endpoints.metrics import request_context, stage
+from .endpoints.nurses import get_nurse_shift, get_roster
+from .endpoints.historic import get_historic, load_inputs
 from .endpoints.rooms import distribute_rooms
 from .endpoints.assign import assign_nurses
 
-def main(query_date, query_shift):
-    start_time = time.time()
+# Blocking calls (func, args) of a pipeline step; gathered steps get the list of their results back
+Step = namedtuple('Step', ['calls', 'gathered'])
+
+def call(func, *args):
+    """ Step running func(*args); the driver sends back its result. """
+    return Step(((func, args),), False)
+
+def gather(*steps):
+    """ Step running the calls of independent steps together; the driver sends back the list of their results. """
+    return Step(tuple(step_call for step in steps for step_call in step.calls), True)
+
+def pipeline(query_date, query_shift, render_job=None, alternatives=None):
+    """ Assignation of a shift, as a generator of its blocking steps shared by main and amain.
+
+    Each yield is a Step: run_steps runs its calls one after another, arun_steps concurrently in
+    worker threads. alternatives receives the next best assignments, see assign_nurses.
+    """
     str_date = query_date.strftime("%Y-%m-%d")
 
     # Print the date and shift being processed
     print(f"[INFO]: Procesando fecha: {str_date}, turno: {query_shift}")
 
-    # Get a list of nurses for a specific shift
-    date, shift, nurses = get_nurse_shift(query_date, query_shift)
-    
-    print(f"[INFO]: IDs de las enfermeras {nurses}")
-    print(f"[INFO]: get_nurses_shift took {time.time() - start_time:.2f} seconds")
+    try:
+        with request_context(date=str_date, shift=query_shift), stage('total'):
+            # The roster and the admissions/history files are independent
+            with stage('load_inputs'):
+                roster, inputs = yield gather(call(get_roster, query_date), call(load_inputs))
+
+            # Get a list of nurses for a specific shift
+            with stage('get_nurse_shift'):
+                date, shift, nurses = get_nurse_shift(query_date, query_shift, roster)
+
+            print(f"[INFO]: IDs de las enfermeras {nurses}")
 
-    # Get the historic data for the given date, shift, nurses and patients
-    historic_start = time.time()
-    occupied_rooms, rooms_per_control, historic = get_historic(date, shift, nurses)
-    print(f"[INFO]: get_historic took {time.time() - historic_start:.2f} seconds")
+            # Get the historic data for the given date, shift, nurses and patients
+            with stage('get_historic'):
+                occupied_rooms, rooms_per_control, historic = yield call(get_historic, date, shift, nurses, inputs)
 
-    # Create groups of rooms based on the number of nurses per control
-    distribute_start = time.time()
-    distributed_rooms = distribute_rooms(occupied_rooms, rooms_per_control, str_date, query_shift)
-    print(f"[INFO]: distribute_rooms took {time.time() - distribute_start:.2f} seconds")
+            # Create groups of rooms based on the number of nurses per control
+            with stage('distribute_rooms'):
+                distributed_rooms = yield call(
+                    distribute_rooms, occupied_rooms, rooms_per_control, str_date, query_shift, render_job
+                )
 
-    # Assign nurses to the distributed rooms given historic data
-    assign_start = time.time()
-    best_mapping = assign_nurses(distributed_rooms, nurses, historic, query_date, str_date, query_shift)
-    print(f"[INFO]: assign_nurses took {time.time() - assign_start:.2f} seconds")
+            # Assign nurses to the distributed rooms given historic data
+            with stage('assign_nurses'):
+                best_mapping = yield call(
+                    assign_nurses, distributed_rooms, nurses, historic, query_date, str_date, query_shift, render_job,
+                    alternatives
+                )
+    except asyncio.CancelledError:
+        print(f"[INFO]: Asignación cancelada para {str_date}, turno: {query_shift}")
+        raise
 
     print(f"[INFO]: Asignación: \n {best_mapping}")
-    print(f"[INFO]: Total execution time: {time.time() - start_time:.2f} seconds")
 
     return best_mapping
 
+def run_steps(steps):
+    """ Drive a generator of steps in this thread, returning its result. """
+    try:
+        step = next(steps)
+        while True:
+            try:
+                values = [func(*args) for func, args in step.calls]
+            except Exception as e:
+                # Raised inside the generator, so its stages record the failure
+                step = steps.throw(e)
+            else:
+                step = steps.send(values if step.gathered else values[0])
+    except StopIteration as done:
+        return done.value
+
+def in_thread(func, *args):
+    """ Run a blocking function in a worker thread, keeping the event loop free. """
+    return sync_to_async(func, thread_sensitive=False)(*args)
+
+async def arun_steps(steps):
+    """ run_steps for async views: the calls of each step run concurrently in worker threads, off the event loop.
+
+    Cancelling the task (the client went away) stops the generator before its next step.
+    """
+    try:
+        step = next(steps)
+        while True:
+            try:
+                values = await asyncio.gather(*(in_thread(func, *args) for func, args in step.calls))
+            except (Exception, asyncio.CancelledError) as e:
+                step = steps.throw(e)
+            else:
+                step = steps.send(list(values) if step.gathered else values[0])
+    except StopIteration as done:
+        return done.value
+
+def main(query_date, query_shift, render_job=None, alternatives=None):
+    return run_steps(pipeline(query_date, query_shift, render_job, alternatives))
+
+async def amain(query_date, query_shift, render_job=None, alternatives=None):
+    """ main for async views: the roster and the admissions/history load concurrently and every stage
+    runs off the event loop.
+    """
+    return await arun_steps(pipeline(query_date, query_shift, render_job, alternatives))
+
+# Results per (date, shift, input files content), including the rendered images
+results = ResultCache(settings.RESULT_CACHE_SIZE, settings.RESULT_CACHE_DIR)
+
+def input_files():
+    return [settings.EXCEL_PATH, settings.FILE_HOSP, settings.FILE_HISTORIC, settings.FILE_CONTROLS]
+
+def result_key(query_date, query_shift, mode='png'):
+    # Joint mode gives other groups for the same inputs, so its results are cached apart
+    digests = tuple(file_digest(path) for path in input_files())
+    return (query_date.strftime("%Y-%m-%d"), query_shift, digests, mode, settings.JOINT_ASSIGNATION)
+
+def artifact_id(key):
+    """ Name of the directory holding the images of a result, readable and unique per input files. """
+    return f"{key[0]}_{key[1]}_{hashlib.sha256(repr(key[2]).encode()).hexdigest()[:16]}"
+
+def cached_pipeline(query_date, query_shift, render_job, key):
+    """ Serve the assignation from the result cache, running the pipeline only for new dates, shifts or input files. """
+    cached = yield call(results.get, key)
+    if cached is not None:
+        print(f"[INFO]: Asignación en caché para {key[0]}, turno: {query_shift}")
+        yield call(render_job.restore, cached['images'])
+        return copy.deepcopy(cached['data'])
+
+    best_mapping = yield from pipeline(query_date, query_shift, render_job)
+    data = copy.deepcopy(best_mapping)
+    render_job.when_done(lambda images: results.put(key, {'data': data, 'images': images}))
+    return best_mapping
+
+def cached_main(query_date, query_shift, render_job, key):
+    return run_steps(cached_pipeline(query_date, query_shift, render_job, key))
+
+async def cached_amain(query_date, query_shift, render_job, key):
+    """ cached_main for async views. """
+    return await arun_steps(cached_pipeline(query_date, query_shift, render_job, key))
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
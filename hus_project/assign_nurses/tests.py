@@ -0,0 +1,132 @@
+import itertools
+import os
+import tempfile
+import time
+from datetime import datetime
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.test import Client, SimpleTestCase, TransactionTestCase, override_settings
+
+from . import incremental
+from .continuity import continuity_weights
+from .endpoints import history_store, kbest, render
+from .endpoints.nurses import extract_nurse_ids
+from .models import HistoryIngestion, TreatmentDay
+
+
+class SyncHistoryTests(TransactionTestCase):
+    """ sync_history must fold every row of the history file into the store exactly once. """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'historic.xlsx')
+        pd.DataFrame({
+            'ID_ENF': [251, 251, 252],
+            'ID_PACIENTE': [1001, 1001, 1002],
+            'FECHA_TOMA': [datetime(2025, 10, 1, 8), datetime(2025, 10, 1, 20), datetime(2025, 10, 2, 8)],
+        }).to_excel(self.path, index=False)
+
+    def treatments(self):
+        return sorted(TreatmentDay.objects.values_list('nurse_id', 'patient_id', 'treatments'))
+
+    def test_sync_counts_rows_once(self):
+        self.assertEqual(history_store.sync_history(self.path), 3)
+        self.assertEqual(history_store.sync_history(self.path), 0)
+        self.assertEqual(self.treatments(), [(251, 1001, 2), (252, 1002, 1)])
+
+    def test_stale_watermark_does_not_add_rows_again(self):
+        # A second sync that read the watermark before the first one advanced it
+        stale = HistoryIngestion.objects.create(source=self.path)
+        history_store.sync_history(self.path)
+        with mock.patch.object(HistoryIngestion.objects, 'get_or_create', return_value=(stale, False)):
+            self.assertEqual(history_store.sync_history(self.path), 0)
+        self.assertEqual(self.treatments(), [(251, 1001, 2), (252, 1002, 1)])
+
+
+class PruneArtifactsTests(SimpleTestCase):
+    """ Pruning removes stale artifact directories, never the one a render job is using. """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(render, 'save_path', directory.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.root = os.path.join(directory.name, render.artifacts_dir)
+
+    def old_directory(self, name):
+        path = os.path.join(self.root, name)
+        os.makedirs(path)
+        old = time.time() - render.artifacts_max_age - 60
+        os.utime(path, (old, old))
+        return path
+
+    def test_reused_directory_survives_pruning(self):
+        reused, stale = self.old_directory('reused'), self.old_directory('stale')
+        job = render.RenderJob('reused')
+        render.prune_artifacts()
+        self.assertTrue(os.path.isdir(reused))
+        self.assertFalse(os.path.exists(stale))
+        render.write_image('table.svg', b'<svg/>', job.output_dir)
+
+
+class UpdateAssignationViewTests(SimpleTestCase):
+    """ The update endpoint is an API: no CSRF token, a bearer token it can't run without, JSON bodies only. """
+
+    def post(self, content_type='application/json', **headers):
+        client = Client(enforce_csrf_checks=True)
+        return client.post('/assignation/update/', '{"date": "bad"}', content_type=content_type, **headers)
+
+    @override_settings(UPDATE_API_TOKEN=None)
+    def test_refused_without_configured_token(self):
+        self.assertEqual(self.post().status_code, 403)
+        self.assertEqual(self.post('text/plain', HTTP_ORIGIN='https://evil.example').status_code, 403)
+
+    @override_settings(UPDATE_API_TOKEN='secret')
+    def test_api_token(self):
+        self.assertEqual(self.post().status_code, 401)
+        self.assertEqual(self.post(HTTP_AUTHORIZATION='Bearer secret').status_code, 400)
+
+    @override_settings(UPDATE_API_TOKEN='secret')
+    def test_json_only(self):
+        self.assertEqual(self.post('text/plain', HTTP_AUTHORIZATION='Bearer secret').status_code, 415)
+
+
+class ShiftLockTests(SimpleTestCase):
+
+    def test_lock_dropped_after_use(self):
+        for day in range(5):
+            with self.assertRaises(ValueError), incremental.shift_lock((f'2025-10-0{day}', 'M')):
+                raise ValueError
+        self.assertEqual(incremental.shift_locks, {})
+
+
+class ExtractNurseIdsTests(SimpleTestCase):
+
+    def test_non_numeric_ids_are_missing(self):
+        ids = extract_nurse_ids(pd.Series(['Ana Ruiz 251', 'R', 'Luis Gil', 'Eva 0252']))
+        self.assertEqual(ids.tolist()[::3], ['251', '0252'])
+        self.assertTrue(ids.iloc[1:3].isna().all())
+
+
+class KBestTests(SimpleTestCase):
+
+    def test_cost_first_then_treatments(self):
+        cost = np.array([[1, 1], [1, 1]])
+        continuity = np.array([[1, 0], [0, 0]])
+        treatments = np.array([[0, 5], [5, 0]])
+        # A continuity weight of 0.3, in tenths of a cost unit, still outweighs any treatments
+        weights = continuity_weights(cost, treatments, continuity, 0.3)
+        ((rows, cols, _),) = kbest.k_best_assignments(weights, 1)
+        self.assertEqual(cols.tolist(), [0, 1])
+        ((rows, cols, _),) = kbest.k_best_assignments(kbest.lexicographic_weights(cost, treatments), 1)
+        self.assertEqual(cols.tolist(), [1, 0])
+
+    def test_k_best_matches_enumeration(self):
+        rng = np.random.default_rng(0)
+        weights = rng.integers(0, 5, (4, 3))
+        totals = sorted(weights[list(rows), range(3)].sum() for rows in itertools.permutations(range(4), 3))
+        self.assertEqual([total for _, _, total in kbest.k_best_assignments(weights, 6)], totals[:6])
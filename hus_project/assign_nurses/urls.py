@@ -5,4 +5,8 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('assignation/', views.assignation, name='assignation'),
     path('assignation/run_main/', views.run_main, name='run_main'),
+    path('assignation/render_status/<str:job_id>/', views.render_status, name='render_status'),
+    path('assignation/batch/', views.batch_plan, name='batch_plan'),
+    path('assignation/update/', views.update_assignation, name='update_assignation'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
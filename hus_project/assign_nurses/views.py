@@ -1,14 +1,22 @@
+import hmac
+import io
+import json
+from importlib import import_module
+from asgiref.sync import sync_to_async
 from django.shortcuts import redirect
 from django.shortcuts import render
-from django.http import JsonResponse
-from . import run_assignation
-from .endpoints import utils
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from .endpoints import metrics, utils
+from .endpoints.render import RENDER_MODES, RenderJob, get_job_status
 
 def index(request):
     current_date, current_shift = utils.get_current_query_params()
     context = {
         'current_date': current_date.strftime("%Y-%m-%d"),
-        'current_shift': current_shift
+        'current_shift': current_shift,
+        'render_mode': settings.RENDER_MODE
     }
     return render(request, 'index.html', context)
 
@@ -16,14 +24,23 @@ def assignation(request):
     if request.method == "POST":
         selected_date = request.POST.get("date")
         selected_shift = request.POST.get("shift")
+        render_mode = request.POST.get("render", settings.RENDER_MODE)
         context = {
             "selected_date": selected_date,
-            "selected_shift": selected_shift
+            "selected_shift": selected_shift,
+            "render_mode": render_mode if render_mode in RENDER_MODES else settings.RENDER_MODE
         }
         return render(request, "assignation.html", context)
     return redirect('index')
 
-def run_main(request):
+async def load_pipeline():
+    """ The assignation pipeline (pandas, scipy...), imported on the first request and off the event loop,
+    so that loading the URLs for other pages and manage.py commands stays light.
+    """
+    return await sync_to_async(import_module, thread_sensitive=False)('assign_nurses.run_assignation')
+
+async def run_main(request):
+    run_assignation = await load_pipeline()
     selected_date = request.GET.get('date')
     selected_shift = request.GET.get('shift')
     if selected_date and selected_shift:
@@ -31,5 +48,118 @@ def run_main(request):
         query_shift = utils.parse_shift(selected_shift)
     else:
         return JsonResponse({'error': 'Invalid date or shift'}, status=400)
-    result = run_assignation.main(query_date, query_shift)
-    return JsonResponse({'data': result})
\ No newline at end of file
+    # ?render=svg or ?render=json for lightweight images, drawn by the page in json mode
+    render_mode = request.GET.get('render', settings.RENDER_MODE)
+    if render_mode not in RENDER_MODES:
+        return JsonResponse({'error': f"Invalid render mode, expected one of {', '.join(RENDER_MODES)}"}, status=400)
+    # The images are rendered in the background; the page polls render_status for them
+    key = await run_assignation.in_thread(run_assignation.result_key, query_date, query_shift, render_mode)
+    render_job = await run_assignation.in_thread(RenderJob, run_assignation.artifact_id(key), render_mode)
+
+    # ?alternatives=1 adds the next best assignments of the same groups, for the charge nurse to choose
+    alternatives = [] if request.GET.get('alternatives') == '1' else None
+
+    # Opt-in profile of the request with ?profile=cprofile or ?profile=pyinstrument
+    profile_kind = request.GET.get('profile')
+    if profile_kind and settings.ALLOW_PROFILING:
+        profile = metrics.Profile(profile_kind)
+
+        def profiled_main():
+            with profile.capture():
+                return run_assignation.main(query_date, query_shift, render_job, alternatives)
+
+        # Profiled synchronously in one thread, so the profile sees the whole pipeline
+        result = await run_assignation.in_thread(profiled_main)
+    elif alternatives is not None:
+        # The result cache holds the best assignment only
+        profile = None
+        result = await run_assignation.amain(query_date, query_shift, render_job, alternatives)
+    else:
+        profile = None
+        result = await run_assignation.cached_amain(query_date, query_shift, render_job, key)
+
+    response = {'data': result, 'job': render_job.id, 'images': render_job.image_urls(), 'render': render_mode}
+    if alternatives is not None:
+        response['alternatives'] = alternatives
+    if profile is not None:
+        response['profile'] = {'kind': profile.kind, 'report': profile.report}
+    return JsonResponse(response)
+
+def batch_plan(request):
+    """ Assignations of every shift from start to end, streamed as NDJSON or returned as an Excel workbook.
+
+    With ?continuity=1 the shifts are solved in order, keeping the rooms of nurses on back-to-back shifts.
+    """
+    from . import batch, continuity
+
+    try:
+        start = utils.parse_date(request.GET.get('start', ''))
+        end = utils.parse_date(request.GET.get('end', ''))
+        shifts = [utils.shift_code(shift) for shift in request.GET.get('shifts', ','.join(batch.SHIFTS)).split(',')]
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not 0 <= (end - start).days < settings.BATCH_MAX_DAYS:
+        return JsonResponse({'error': f'Invalid date range, at most {settings.BATCH_MAX_DAYS} days'}, status=400)
+
+    if request.GET.get('continuity') == '1':
+        results = continuity.plan_continuity(start, end, shifts)
+    else:
+        results = batch.plan_batch(start, end, shifts)
+    if request.GET.get('format') == 'xlsx':
+        output = io.BytesIO()
+        batch.write_workbook(results, output)
+        response = HttpResponse(
+            output.getvalue(),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        response['Content-Disposition'] = f'attachment; filename="plan_{start:%Y-%m-%d}_{end:%Y-%m-%d}.xlsx"'
+        return response
+    return StreamingHttpResponse(batch.to_ndjson(results), content_type='application/x-ndjson')
+
+@csrf_exempt
+def update_assignation(request):
+    """ Apply admissions, discharges, bed moves or absent nurses to the last assignation of a shift.
+
+    POST a JSON body {"date", "shift", "admit": [{"patient", "bed"}], "discharge": [patient],
+    "move": [{"patient", "bed"}], "absent": [nurse]}; only the controls it touches are regrouped.
+    API clients have no CSRF token, so they authenticate with UPDATE_API_TOKEN instead; without
+    it configured the endpoint refuses every update.
+    """
+    from . import incremental
+
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST expected'}, status=405)
+    if not settings.UPDATE_API_TOKEN:
+        return JsonResponse({'error': 'Updates are disabled, UPDATE_API_TOKEN is not set'}, status=403)
+    expected = f"Bearer {settings.UPDATE_API_TOKEN}"
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected.encode()):
+        return JsonResponse({'error': 'Invalid or missing token'}, status=401)
+    # Browsers send cross-site forms as text/plain or form data, never as JSON without a preflight
+    if request.content_type != 'application/json':
+        return JsonResponse({'error': 'Content-Type must be application/json'}, status=415)
+    render_mode = request.GET.get('render', settings.RENDER_MODE)
+    if render_mode not in RENDER_MODES:
+        return JsonResponse({'error': f"Invalid render mode, expected one of {', '.join(RENDER_MODES)}"}, status=400)
+    try:
+        body = json.loads(request.body)
+        query_date = utils.parse_date(body.get('date', ''))
+        query_shift = utils.shift_code(body.get('shift', ''))
+        delta = incremental.parse_delta(body)
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        return JsonResponse({'error': f'Invalid update: {e}'}, status=400)
+
+    try:
+        response = incremental.update_assignation(query_date, query_shift, delta, render_mode)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    response['render'] = render_mode
+    return JsonResponse(response)
+
+def metrics_view(request):
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4')
+
+def render_status(request, job_id):
+    status = get_job_status(job_id)
+    if status is None:
+        return JsonResponse({'error': 'Unknown render job'}, status=404)
+    return JsonResponse({'status': status})
\ No newline at end of file
@@ -0,0 +1,14 @@
+import os
+import sys
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup():
+    """ Configure Django so the endpoint modules can be imported outside of manage.py. """
+    if str(PROJECT_DIR) not in sys.path:
+        sys.path.insert(0, str(PROJECT_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hus_project.settings')
+    import django
+    django.setup()
@@ -0,0 +1,67 @@
+"""
+Benchmark of the rolling-horizon continuity planner against independent shift solves.
+
+On a synthetic dataset, plans a week of M, T and N shifts three ways: every shift solved on
+its own (batch.plan_batch with one worker), continuity.plan_continuity without the continuity
+term, which must give the same assignations, and with it. For each it reports the time, the
+rooms that nurses working back-to-back shifts keep and the total cost.
+
+Usage (from the directory containing manage.py):
+    python -m benchmarks.continuity
+    python -m benchmarks.continuity --scale large --weights 1 2 4
+"""
+import argparse
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from .run import QUERY_DATE, SCALES, measure, use_dataset
+
+from django.conf import settings  # noqa: E402
+from assign_nurses import batch, continuity  # noqa: E402
+from . import synthetic  # noqa: E402
+
+START, END = datetime(2025, 10, 13), datetime(2025, 10, 19)
+
+
+def summarize(results):
+    solved = [result for result in results if 'data' in result]
+    return {
+        'shifts': len(solved),
+        'kept': sum(result.get('continuity', 0) for result in solved),
+        'cost': sum(result.get('cost', 0) for result in solved),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALES, default='medium')
+    parser.add_argument('--weights', type=float, nargs='+', default=[settings.CONTINUITY_WEIGHT])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        paths = synthetic.write_dataset(
+            Path(workdir) / args.scale, query_date=QUERY_DATE, start_row=settings.START_ROW, **SCALES[args.scale]
+        )
+        with use_dataset(paths, workdir):
+            # Warm the roster, admissions and history caches, shared by every run
+            list(batch.plan_batch(START, START, ['M'], workers=1))
+
+            independent_time, independent = measure(lambda: list(batch.plan_batch(START, END, workers=1)), args.repeat)
+            baseline_time, baseline = measure(lambda: list(continuity.plan_continuity(START, END, weight=0)), args.repeat)
+            same = [result.get('data') for result in independent] == [result.get('data') for result in baseline]
+
+            print(f"{'plan':<24} {'time':>10} {'kept rooms':>11} {'cost':>8}")
+            print(f"{'independent':<24} {independent_time * 1000:>8.1f}ms {'-':>11} {'-':>8}")
+            rows = [('continuity weight=0', baseline_time, summarize(baseline))]
+            for weight in args.weights:
+                seconds, results = measure(lambda: list(continuity.plan_continuity(START, END, weight=weight)), args.repeat)
+                rows.append((f"continuity weight={weight:g}", seconds, summarize(results)))
+            for name, seconds, summary in rows:
+                print(f"{name:<24} {seconds * 1000:>8.1f}ms {summary['kept']:>11} {summary['cost']:>8}")
+            print(f"{rows[0][2]['shifts']} turnos; weight=0 igual a los turnos independientes: {'sí' if same else 'NO'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark of the cost-matrix construction used by assign.create_branch_schema.
+
+Compares the per-cell reference (calculate_cost / count_group_treatments) with
+build_cost_matrices on synthetic floors of increasing size, and checks that both
+produce the same matrices and the same Hungarian assignment.
+
+Usage (from the directory containing manage.py):
+    python -m benchmarks.cost_matrix
+"""
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from . import setup
+
+setup()
+
+from scipy.optimize import linear_sum_assignment  # noqa: E402
+from assign_nurses.endpoints import assign, schema  # noqa: E402
+
+FLOOR_SIZES = [5, 10, 20, 30]
+PATIENTS_PER_NURSE = 11
+
+
+def synthetic_floor(n_nurses, query_date, seed=0):
+    """ Build nurses, room groups and a historic summary for a floor with n_nurses groups. """
+    rng = np.random.default_rng(seed)
+    nurses = [str(250 + i) for i in range(n_nurses)]
+    rooms = []
+    for number in range(n_nurses * PATIENTS_PER_NURSE):
+        room = str(100 + number // 2) + ('B' if number % 2 else '')
+        rooms.append(room)
+    groups = {
+        f"G{j + 1}": rooms[j * PATIENTS_PER_NURSE:(j + 1) * PATIENTS_PER_NURSE]
+        for j in range(n_nurses)
+    }
+
+    n_pairs = len(nurses) * len(rooms) // 3
+    pairs = pd.DataFrame({
+        'ID_ENF': rng.choice(schema.nurse_ids(nurses), n_pairs),
+        'HABITACION': rng.choice(rooms, n_pairs),
+    }).drop_duplicates()
+    pairs['ID_PACIENTE'] = pairs['HABITACION'].map({room: k for k, room in enumerate(rooms)})
+    pairs['NUMERO_TRATAMIENTOS'] = rng.integers(1, 30, len(pairs))
+    pairs['FECHA_TOMA_MÁS_RECIENTE'] = pd.Timestamp(query_date).normalize() - pd.to_timedelta(
+        rng.integers(0, 180, len(pairs)), unit='D'
+    )
+    return nurses, groups, schema.typed_resume(pairs)
+
+
+def reference_matrices(nurses, groups, historic, query_date):
+    cost_matrix = np.zeros((len(nurses), len(groups)))
+    treatments_matrix = np.zeros((len(nurses), len(groups)))
+    for i, nurse in enumerate(nurses):
+        for j, group_values in enumerate(groups.values()):
+            cost_matrix[i][j] = assign.calculate_cost(group_values, nurse, historic, query_date)
+            treatments_matrix[i][j] = assign.count_group_treatments(nurse, group_values, historic)
+    return cost_matrix, treatments_matrix
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    query_date = datetime(2025, 10, 15)
+    print(f"{'nurses':>7} {'rooms':>6} {'history':>8} {'reference':>11} {'vectorized':>11} {'speedup':>8}")
+    for n_nurses in FLOOR_SIZES:
+        nurses, groups, historic = synthetic_floor(n_nurses, query_date)
+        (ref_cost, ref_treat), ref_time = timed(reference_matrices, nurses, groups, historic, query_date)
+        (vec_cost, vec_treat), vec_time = timed(assign.build_cost_matrices, nurses, groups, historic, query_date)
+
+        assert np.array_equal(ref_cost, vec_cost), "Cost matrices differ"
+        assert np.array_equal(ref_treat, vec_treat), "Treatment matrices differ"
+        assert np.array_equal(linear_sum_assignment(ref_cost)[1], linear_sum_assignment(vec_cost)[1])
+
+        n_rooms = sum(len(group) for group in groups.values())
+        print(f"{n_nurses:>7} {n_rooms:>6} {len(historic):>8} {ref_time:>10.3f}s {vec_time:>10.4f}s {ref_time / vec_time:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
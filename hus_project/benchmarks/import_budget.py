@@ -0,0 +1,75 @@
+"""
+Import-time budget of the app, measured with python -X importtime.
+
+Loading the URLs (what every page, manage.py check and migrate do) must not import the
+pipeline dependencies, and the solving path used by batch plans and pool workers must not
+import matplotlib. Each target runs in a fresh interpreter; the script exits with status 1
+when a target imports a forbidden module or exceeds its time budget.
+
+Usage (from the directory containing manage.py):
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --verbose
+"""
+import argparse
+import subprocess
+import sys
+
+from . import PROJECT_DIR
+
+SETUP = (
+    "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hus_project.settings'); "
+    "import django; django.setup(); "
+)
+
+# name: (code run after django.setup(), forbidden top-level packages, budget in seconds)
+TARGETS = {
+    'urls': ("import hus_project.urls", ['pandas', 'numpy', 'scipy', 'matplotlib', 'openpyxl', 'pyarrow'], 0.6),
+    'solve': ("import assign_nurses.batch", ['matplotlib', 'scipy', 'openpyxl'], 1.5),
+}
+
+
+def import_times(code):
+    """ Self and cumulative import time in seconds of every module imported by code in a fresh interpreter. """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', SETUP + code],
+        cwd=PROJECT_DIR, capture_output=True, text=True
+    )
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+
+    modules = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+    return modules
+
+
+def check(name, code, forbidden, budget, verbose=False):
+    modules = import_times(code)
+    total = sum(self_time for self_time, _ in modules.values())
+    imported = sorted({module for module in modules if module.split('.')[0] in forbidden})
+    ok = not imported and total <= budget
+
+    print(f"{'OK  ' if ok else 'FAIL'} {name:<6} {total * 1000:8.1f} ms (budget {budget * 1000:.0f} ms)")
+    if imported:
+        print(f"     imports forbidden modules: {', '.join(sorted({module.split('.')[0] for module in imported}))}")
+    if verbose:
+        slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:10]
+        for module, (_, cumulative) in slowest:
+            print(f"     {cumulative * 1000:8.1f} ms  {module}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verbose', action='store_true', help="List the slowest imports of every target.")
+    args = parser.parse_args()
+
+    results = [check(name, *target, verbose=args.verbose) for name, target in TARGETS.items()]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark of the joint room-grouping and assignment search (assign.joint_groups).
+
+For each synthetic scale, groups the rooms with distribute_rooms and scores that grouping
+(assignment cost plus orphaned 'B' beds) as the sequential pipeline leaves it, then runs
+search_groups with increasing time budgets and reports the score and the time it took.
+
+Usage (from the directory containing manage.py):
+    python -m benchmarks.joint
+    python -m benchmarks.joint --scales medium large --budgets 0.1 0.5 2
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from .run import QUERY_DATE, QUERY_SHIFT, SCALES, DeferredRenderJob, use_dataset
+
+from django.conf import settings  # noqa: E402
+from assign_nurses.endpoints import assign, historic, joint, nurses, rooms  # noqa: E402
+from . import synthetic  # noqa: E402
+
+
+def bench_scale(scale, budgets, workdir):
+    paths = synthetic.write_dataset(Path(workdir) / scale, query_date=QUERY_DATE, start_row=settings.START_ROW, **SCALES[scale])
+    with use_dataset(paths, workdir):
+        date, shift, shift_nurses = nurses.get_nurse_shift(QUERY_DATE, QUERY_SHIFT)
+        occupied_rooms, rooms_per_control, summary = historic.get_historic(date, shift, shift_nurses)
+        groups = rooms.distribute_rooms(occupied_rooms, rooms_per_control, str(date), QUERY_SHIFT, DeferredRenderJob())
+        merged = assign.merge_historial_resume(summary)
+
+        room_index = {}
+        for control_groups in groups.values():
+            for group in control_groups.values():
+                for room in group:
+                    room_index.setdefault(room, len(room_index))
+        pair_cost, _ = assign.pair_matrices(shift_nurses, room_index, merged, QUERY_DATE)
+        max_patients = historic.max_patients_per_nurse(QUERY_SHIFT)
+
+        print(f"[{scale}] {len(shift_nurses)} enfermeras, {len(room_index)} camas")
+        sequential = joint.GroupSearch(groups, pair_cost, room_index, settings.JOINT_ORPHAN_COST)
+        print(f"  {'sequential':<16} {sequential.score(sequential.initial):>8.0f}")
+        for budget in budgets:
+            start = time.perf_counter()
+            _, score = joint.search_groups(
+                groups, pair_cost, room_index, max_patients, budget, settings.JOINT_MAX_ROUNDS,
+                settings.JOINT_SIZE_SLACK, settings.JOINT_ORPHAN_COST
+            )
+            seconds = time.perf_counter() - start
+            print(f"  {f'joint {budget:g}s':<16} {score:>8.0f}   {seconds * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', choices=SCALES, default=['small', 'medium', 'large'])
+    parser.add_argument('--budgets', type=float, nargs='+', default=[0.05, settings.JOINT_TIME_BUDGET, 2.0])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in args.scales:
+            bench_scale(scale, args.budgets, workdir)
+
+
+if __name__ == '__main__':
+    main()
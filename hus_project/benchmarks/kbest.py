@@ -0,0 +1,66 @@
+"""
+Benchmark of the lexicographic and k-best assignment solves of assign.rank_branch_schemas.
+
+On the synthetic floors of benchmarks.cost_matrix, times one Hungarian solve of the cost matrix
+(the assignment before tie-breaking), the lexicographic solve of the best assignment and Murty's
+k best assignments, reporting each against the single solve. It also checks that the best
+assignment keeps the minimum cost and has at least as many treatments.
+
+Usage (from the directory containing manage.py):
+    python -m benchmarks.kbest
+    python -m benchmarks.kbest --k 3 5 10 --repeat 50
+"""
+import argparse
+import time
+from datetime import datetime
+
+from .cost_matrix import FLOOR_SIZES, synthetic_floor
+
+from scipy.optimize import linear_sum_assignment  # noqa: E402
+from assign_nurses.endpoints import assign, kbest  # noqa: E402
+
+
+def timed(func, repeat):
+    """ Best time of repeat calls of func, and its result. """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--k', type=int, nargs='+', default=[3, 5])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    query_date = datetime(2025, 10, 15)
+    columns = ['hungarian', 'lexicographic'] + [f'k={k}' for k in args.k]
+    print(f"{'nurses':>7} " + ' '.join(f"{column:>20}" for column in columns) + f" {'treatments':>12}")
+    for n_nurses in FLOOR_SIZES:
+        nurses, groups, historic = synthetic_floor(n_nurses, query_date)
+        cost_matrix, treatments_matrix = assign.build_cost_matrices(nurses, groups, historic, query_date)
+
+        base_time, (row_ind, col_ind) = timed(lambda: linear_sum_assignment(cost_matrix), args.repeat)
+        times = [base_time]
+        lexicographic_time, ((best_rows, best_cols, _),) = timed(
+            lambda: kbest.k_best_assignments(kbest.lexicographic_weights(cost_matrix, treatments_matrix), 1),
+            args.repeat
+        )
+        times.append(lexicographic_time)
+        for k in args.k:
+            weights = kbest.lexicographic_weights(cost_matrix, treatments_matrix)
+            times.append(timed(lambda: kbest.k_best_assignments(weights, k), args.repeat)[0])
+
+        assert cost_matrix[best_rows, best_cols].sum() == cost_matrix[row_ind, col_ind].sum(), "Cost changed"
+        before, after = treatments_matrix[row_ind, col_ind].sum(), treatments_matrix[best_rows, best_cols].sum()
+        assert after >= before, "Fewer treatments"
+
+        cells = ' '.join(f"{seconds * 1000:>10.3f}ms {seconds / base_time:>6.1f}x" for seconds in times)
+        print(f"{n_nurses:>7} {cells} {before:>5.0f} -> {after:<5.0f}")
+
+
+if __name__ == '__main__':
+    main()
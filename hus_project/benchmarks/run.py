@@ -0,0 +1,197 @@
+"""
+Stage and endpoint benchmarks of the assignation pipeline on synthetic datasets.
+
+Each scale generates a dataset with benchmarks.synthetic, points the endpoint modules at
+it and times every stage of run_assignation.main and the endpoint functions in isolation.
+Results are written as JSON and CSV and can be compared with a previous baseline.
+
+Usage (from the directory containing manage.py):
+    python -m benchmarks.run --scales small medium --output benchmarks/results/current.json
+    python -m benchmarks.run --baseline benchmarks/results/baseline.json
+"""
+import argparse
+import csv
+import json
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from . import setup
+
+setup()
+
+from django.conf import settings  # noqa: E402
+from scipy.optimize import linear_sum_assignment  # noqa: E402
+from assign_nurses.endpoints import assign, historic, layout, nurses, render, rooms, snapshots  # noqa: E402
+from assign_nurses.endpoints.cache import digest_cache  # noqa: E402
+from . import synthetic  # noqa: E402
+
+# rooms_per_control counts rooms of two beds each
+SCALES = {
+    'small': dict(n_floors=1, controls_per_floor=2, rooms_per_control=15, n_nurses=30, months=6, rows_per_day=50),
+    'medium': dict(n_floors=1, controls_per_floor=2, rooms_per_control=30, n_nurses=40, months=12, rows_per_day=150),
+    'large': dict(n_floors=4, controls_per_floor=3, rooms_per_control=30, n_nurses=160, months=24, rows_per_day=400),
+}
+QUERY_DATE = datetime(2025, 10, 15)
+QUERY_SHIFT = 'M'
+REGRESSION_THRESHOLD = 1.25
+NOISE_FLOOR = 0.002  # Seconds; faster benchmarks are reported but never flagged
+
+
+class DeferredRenderJob:
+    """ Collects the figures the pipeline asks for so that rendering is timed on its own. """
+
+    def __init__(self):
+        self.calls = {}
+
+    def submit(self, func, *args, **kwargs):
+        self.calls[func.__name__] = (func, args, kwargs)
+
+
+@contextmanager
+def use_dataset(paths, output_dir):
+    """ Point the endpoint modules at a synthetic dataset, restoring them afterwards. """
+    patches = [
+        (nurses, 'excel_path', paths['roster']),
+        (historic, 'file_hosp', paths['admissions']),
+        (historic, 'file_controls', paths['controls']),
+        (historic, 'file_historic', paths['history']),
+        (historic, 'use_history_store', False),
+        (rooms, 'file_controls', paths['controls']),
+        (render, 'save_path', output_dir),
+        (snapshots, 'snapshot_path', Path(output_dir) / 'snapshots'),
+    ]
+    originals = [(module, name, getattr(module, name)) for module, name, _ in patches]
+    for module, name, value in patches:
+        setattr(module, name, value)
+    nurses.roster_cache.clear()
+    digest_cache.clear()
+    try:
+        yield
+    finally:
+        for module, name, value in originals:
+            setattr(module, name, value)
+        nurses.roster_cache.clear()
+
+
+def measure(func, repeat):
+    """ Median wall time of func over repeat runs, with the result of the last run. """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def bench_scale(scale, params, repeat, workdir):
+    paths = synthetic.write_dataset(Path(workdir) / scale, query_date=QUERY_DATE, start_row=settings.START_ROW, **params)
+    records = []
+
+    def record(name, func, runs=repeat):
+        seconds, result = measure(func, runs)
+        records.append({'scale': scale, 'benchmark': name, 'seconds': seconds, 'repeat': runs})
+        print(f"  {name:<40} {seconds * 1000:>10.2f} ms")
+        return result
+
+    with use_dataset(paths, Path(workdir) / scale):
+        # Stages of run_assignation.main, in order, feeding each one with the previous result
+        record('stage.get_nurse_shift.cold', lambda: (nurses.roster_cache.clear(), nurses.get_nurse_shift(QUERY_DATE, QUERY_SHIFT))[1])
+        date, shift, shift_nurses = record('stage.get_nurse_shift.warm', lambda: nurses.get_nurse_shift(QUERY_DATE, QUERY_SHIFT))
+        occupied_rooms, rooms_per_control, summary = record(
+            'stage.get_historic', lambda: historic.get_historic(date, shift, shift_nurses)
+        )
+        render_job = DeferredRenderJob()
+        groups = record(
+            'stage.distribute_rooms',
+            lambda: rooms.distribute_rooms(occupied_rooms, rooms_per_control, str(date), QUERY_SHIFT, render_job)
+        )
+        record(
+            'stage.assign_nurses',
+            lambda: assign.assign_nurses(groups, shift_nurses, summary, QUERY_DATE, str(date), QUERY_SHIFT, render_job)
+        )
+
+        # Endpoint functions in isolation
+        controls = record(
+            'historic.extract_patient_bed', lambda: historic.extract_patient_bed(paths['admissions'], paths['controls'])
+        )
+        bed_index = record(
+            'historic.admissions_index', lambda: historic.admissions_index(paths['admissions'], paths['controls'])
+        )
+        record(
+            'historic.treatment_historial',
+            lambda: historic.treatment_historial(paths['history'], controls, shift_nurses, date, bed_index=bed_index)
+        )
+        floor_layout = record('layout.compile', lambda: layout.FloorLayout.from_file(paths['controls']))
+        first_control = next(iter(occupied_rooms))
+        positions = record('layout.occupied', lambda: floor_layout.occupied(first_control, occupied_rooms[first_control]))
+        rooms_items, pairs = floor_layout.items(positions), floor_layout.pairs(positions)
+        record(
+            'rooms.create_room_groups',
+            lambda: rooms.create_room_groups(list(rooms_items), rooms_per_control[first_control], pairs)
+        )
+        all_groups = assign.extract_and_assign_groups(groups)
+        merged = assign.merge_historial_resume(summary)
+        cost_matrix, _ = record(
+            'assign.build_cost_matrices', lambda: assign.build_cost_matrices(shift_nurses, all_groups, merged, QUERY_DATE)
+        )
+        record('assign.linear_sum_assignment', lambda: linear_sum_assignment(cost_matrix))
+        for name, (func, args, kwargs) in render_job.calls.items():
+            kwargs = {**kwargs, 'output_dir': str(Path(workdir) / scale)}
+            record(f"render.{name}", lambda: func(*args, **kwargs), runs=1)
+
+    return records
+
+
+def compare(records, baseline_path):
+    """ Print the ratio of every benchmark to the baseline, flagging slowdowns. Returns the regressions. """
+    with open(baseline_path) as file:
+        baseline = {(r['scale'], r['benchmark']): r['seconds'] for r in json.load(file)['results']}
+    regressions = []
+    for r in records:
+        previous = baseline.get((r['scale'], r['benchmark']))
+        if not previous:
+            continue
+        ratio = r['seconds'] / previous
+        flag = '  REGRESSION' if ratio > REGRESSION_THRESHOLD and r['seconds'] > NOISE_FLOOR else ''
+        print(f"  {r['scale']:<8} {r['benchmark']:<40} x{ratio:>6.2f}{flag}")
+        if flag:
+            regressions.append(r)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='+', choices=SCALES, default=['small', 'medium'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', type=Path, default=Path(__file__).parent / 'results' / 'latest.json')
+    parser.add_argument('--baseline', type=Path, help="Previous results to compare against.")
+    args = parser.parse_args()
+
+    records = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in args.scales:
+            print(f"[{scale}] {SCALES[scale]}")
+            records += bench_scale(scale, SCALES[scale], args.repeat, workdir)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w') as file:
+        json.dump({'created': datetime.now().isoformat(timespec='seconds'), 'scales': {s: SCALES[s] for s in args.scales},
+                   'results': records}, file, indent=2)
+    with open(args.output.with_suffix('.csv'), 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=['scale', 'benchmark', 'seconds', 'repeat'])
+        writer.writeheader()
+        writer.writerows(records)
+    print(f"Resultados guardados en {args.output}")
+
+    if args.baseline:
+        regressions = compare(records, args.baseline)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} benchmarks más lentos que la referencia")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Generators of synthetic hospital input files with the layout of the real ones:
+Ingresados.xlsx (admissions), the roster workbook (excel2025.xlsm), hcoIngresos.xlsx
+(treatment history) and controls.json (floor layout).
+"""
+import json
+import calendar
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from assign_nurses.endpoints.nurses import MONTH_SHEETS
+
+SHIFT_CODES = ['M', 'T', 'N', 'M;T', 'T;N', 'N;M', 'L', '-']
+SHIFT_WEIGHTS = [0.22, 0.2, 0.14, 0.03, 0.03, 0.02, 0.3, 0.06]
+
+
+def generate_controls(n_floors=1, controls_per_floor=2, rooms_per_control=30, first_floor=4):
+    """ Layout of n_floors floors split into controls, each room with an A and a B bed.
+
+    Rooms are numbered floor * 100 + k, so a floor holds at most 99 rooms. Floors are
+    drawn side by side.
+    """
+    if controls_per_floor * rooms_per_control > 99:
+        raise ValueError("Una planta no puede tener más de 99 habitaciones")
+    controls = {}
+    for f in range(n_floors):
+        floor = first_floor + f
+        for c in range(controls_per_floor):
+            beds = []
+            for k in range(rooms_per_control):
+                number = floor * 100 + c * rooms_per_control + k + 1
+                x = f * 4 * controls_per_floor + 4 * c + 2 * (k // 15)
+                beds.append({'room': str(number), 'x': x, 'y': k % 15})
+                beds.append({'room': f"{number}B", 'x': x + 1, 'y': k % 15})
+            controls[f"control_{floor}{chr(ord('A') + c)}"] = beds
+    return controls
+
+
+def generate_admissions(controls, occupancy=0.8, seed=0):
+    """ Admitted patients occupying a random fraction of the beds of the layout. """
+    rng = np.random.default_rng(seed)
+    beds = [room['room'] for rooms in controls.values() for room in rooms]
+    occupied = [bed for bed in beds if rng.random() < occupancy]
+    patients = rng.choice(np.arange(100000, 1100000), len(occupied), replace=False)
+    return pd.DataFrame({'ID_PACIENTE': patients, 'CAMA': occupied, 'SERVICIO': 'MIN'})
+
+
+def generate_roster_sheet(year, month, nurse_ids, seed=0):
+    """ One month sheet of the roster: a row per nurse and a column per day holding its shift code. """
+    rng = np.random.default_rng(seed)
+    days = [datetime(year, month, day) for day in range(1, calendar.monthrange(year, month)[1] + 1)]
+    sheet = pd.DataFrame({
+        'contrato': 0.0,
+        'turno': '',
+        'NOMBRE Y APELLIDOS': [f"Enfermera {nurse_id}" for nurse_id in nurse_ids],
+    })
+    shifts = rng.choice(SHIFT_CODES, size=(len(nurse_ids), len(days)), p=SHIFT_WEIGHTS)
+    return pd.concat([sheet, pd.DataFrame(shifts, columns=days)], axis=1)
+
+
+def generate_history(patients, nurse_ids, end_date, months, rows_per_day, seed=0):
+    """ Treatment history rows (ID_ENF, ID_PACIENTE, FECHA_TOMA) over the months before end_date. """
+    rng = np.random.default_rng(seed)
+    n_days = months * 30
+    n_rows = n_days * rows_per_day
+    days_back = rng.integers(0, n_days, n_rows)
+    seconds = rng.integers(0, 24 * 3600, n_rows)
+    nurses = rng.choice(np.asarray(nurse_ids, dtype=float), n_rows)
+    nurses[rng.random(n_rows) < 0.01] = np.nan
+    history = pd.DataFrame({
+        'ID_ENF': nurses,
+        'ID_PACIENTE': rng.choice(patients, n_rows),
+        'FECHA_TOMA': pd.Timestamp(end_date) - pd.to_timedelta(days_back, unit='D') + pd.to_timedelta(seconds, unit='s'),
+    })
+    return history.sort_values('FECHA_TOMA').reset_index(drop=True)
+
+
+def write_dataset(directory, n_floors=1, controls_per_floor=2, rooms_per_control=30, n_nurses=40, months=6,
+                  rows_per_day=100, query_date=datetime(2025, 10, 15), start_row=5, seed=0):
+    """ Write a complete synthetic dataset to directory and return the paths of its files. """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = {
+        'controls': directory / 'controls.json',
+        'admissions': directory / 'Ingresados.xlsx',
+        'roster': directory / 'excel2025.xlsm',
+        'history': directory / 'hcoIngresos.xlsx',
+    }
+
+    controls = generate_controls(n_floors, controls_per_floor, rooms_per_control)
+    with open(paths['controls'], 'w') as file:
+        json.dump(controls, file, indent=4)
+
+    admissions = generate_admissions(controls, seed=seed)
+    admissions.to_excel(paths['admissions'], index=False)
+
+    nurse_ids = list(range(250, 250 + n_nurses))
+    with pd.ExcelWriter(paths['roster'], engine='openpyxl') as writer:
+        sheet = generate_roster_sheet(query_date.year, query_date.month, nurse_ids, seed)
+        sheet.to_excel(writer, sheet_name=MONTH_SHEETS[query_date.month], startrow=start_row, index=False)
+
+    history = generate_history(admissions['ID_PACIENTE'].to_numpy(), nurse_ids, query_date, months, rows_per_day, seed)
+    history.to_excel(paths['history'], index=False)
+    return paths
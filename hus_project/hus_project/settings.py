@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -9,6 +10,44 @@ FILE_HOSP = BASE_DIR / 'data' / 'Ingresados.xlsx'
 FILE_HISTORIC = BASE_DIR / 'data' / 'hcoIngresos.xlsx'
 FILE_CONTROLS = BASE_DIR / 'data' / 'controls.json'
 SAVE_PATH = BASE_DIR / 'static' / 'img'
+SAVE_URL = '/static/img/'
+RENDER_WORKERS = 2  # Background threads rendering rooms.png and table.png
+RENDER_MODE = 'png'  # Default format of the images: 'png', or the lighter 'svg' and 'json' (drawn by the page)
+ARTIFACTS_DIR = 'assignations'  # Per-result image directories under SAVE_PATH
+ARTIFACTS_MAX_COUNT = 500
+ARTIFACTS_MAX_AGE = 7 * 24 * 3600  # Seconds
+ARTIFACTS_PRUNE_INTERVAL = 60  # Seconds between scans of the artifact directories
+RESULT_CACHE_SIZE = 128  # Assignations kept in memory per process
+RESULT_CACHE_DIR = None  # Optional directory for a disk tier shared by all processes
+SNAPSHOT_PATH = BASE_DIR / 'data' / 'snapshots'
+HISTORY_STORE = True  # Answer history summaries from the indexed store in DATABASES
+CONTROL_WORKERS = 1  # Processes solving controls in parallel; raise it for hospital-wide controls.json
+BATCH_WORKERS = 4  # Processes solving the shifts of a batch plan in parallel
+BATCH_MAX_DAYS = 62  # Longest date range accepted by the batch endpoint
+JOINT_ASSIGNATION = False  # Search the room groups together with the nurse assignment instead of one after the other
+JOINT_TIME_BUDGET = 0.5  # Seconds of joint search per shift; the best grouping found so far is used
+JOINT_MAX_ROUNDS = 20  # Restarts of the joint search from its best grouping
+JOINT_SIZE_SLACK = 2  # Patients a group may differ from the even split, never above the limit per nurse
+JOINT_ORPHAN_COST = 4  # Joint search cost of a 'B' bed apart from its pair, as much as a room without history
+CONTINUITY_WEIGHT = 2  # Cost discount per room a nurse keeps from their previous shift in continuity plans
+ASSIGNATION_ALTERNATIVES = 3  # Next best assignments of the same groups offered to the charge nurse on request
+PRELOAD_INPUTS = False  # Load the current month's inputs when the server starts, off the request path
+PRELOAD_WATCH_INTERVAL = 30  # Seconds between checks of the input files to refresh them; 0 to only preload once
+
+# Logging: JSON stage timings of the assignation pipeline go to the console
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'metrics': {'class': 'logging.StreamHandler', 'formatter': 'json'},
+    },
+    'loggers': {
+        'assign_nurses.metrics': {'handlers': ['metrics'], 'level': 'INFO', 'propagate': False},
+    },
+}
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -19,6 +58,12 @@ SECRET_KEY = 'django-insecure-^3&9=v-q4yn_f8tok0ehk$g*i*kx640_)q26io*49&4dy2-ufm
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# Allow ?profile=cprofile|pyinstrument on run_main to return a profile of the request
+ALLOW_PROFILING = DEBUG
+
+# Token API clients send as 'Authorization: Bearer <token>' to update assignations; unset disables the endpoint
+UPDATE_API_TOKEN = os.environ.get('UPDATE_API_TOKEN')
+
 ALLOWED_HOSTS = ['*']
 
 